@@ -1,16 +1,18 @@
 from enum import Enum, auto
 import random
 import collections
+import functools
+import math
+import multiprocessing
+import os
+import statistics
+import struct
 import time
 
 # Values for development purposes
 SHOW_GAME_STATE_AT_THE_END = False
 SHOW_GAME_STATE_ON_EACH_TURN = False
 SHOW_PLAYER_ACTIONS = False
-RANDOM_SEED = 42 # Consistent behavior for the time being - use None for real random values
-
-
-random.seed(RANDOM_SEED)
 
 
 class Color(Enum):
@@ -71,8 +73,23 @@ class CardContainer(object):
 
 class Hand(CardContainer):
 
+    def __init__(self, cards):
+        super().__init__(cards)
+        # Numbers of the cards in hand, by color - kept up to date incrementally
+        self.by_color = count_cards_by_color(cards)
+
+    def add(self, card):
+        super().add(card)
+        self.by_color.setdefault(card.color, collections.Counter())[card.number] += 1
+
     def pop(self, index):
-        return self.cards.pop(index)
+        card = self.cards.pop(index)
+        remove_from_count(self.by_color, card)
+        return card
+
+    def insert(self, index, card):
+        self.cards.insert(index, card)
+        self.by_color.setdefault(card.color, collections.Counter())[card.number] += 1
 
 
 class CardStack(CardContainer):
@@ -88,34 +105,90 @@ class CardStack(CardContainer):
 
 
 class Deck(CardContainer):
+    # Number of cards for each number: (regular color, multicolor)
+    COMPOSITION = {
+        1: (3, 1),
+        2: (2, 1),
+        3: (2, 1),
+        4: (2, 1),
+        5: (1, 1),
+    }
 
     @classmethod
-    def get_deck(cls):
-        deck_comp = {
-            1: (3, 1),
-            2: (2, 1),
-            3: (2, 1),
-            4: (2, 1),
-            5: (1, 1),
-        }
-
+    def get_deck(cls, rng=random):
         deck = []
         for col in Color:
-            for nb, nb_card in deck_comp.items():
+            for nb, nb_card in cls.COMPOSITION.items():
                 deck.extend([Card(nb, col)] * nb_card[col == Color.MULTI])
-        random.shuffle(deck)
+        rng.shuffle(deck)
         return cls(deck)
 
     def draw_card(self):
          return self.cards.pop()
 
 
-class Player(object): # To replace Hand ?
-    pass
+class ActionType(Enum):
+    PLAY = auto()
+    DISCARD = auto()
+    HINT = auto()
+
+
+Action = collections.namedtuple("Action", ["type", "card_index", "target_player_index"], defaults=[None, None])
+
+
+class Player(object):
+    """Strategy choosing the action of a player from the GameView built for their turn."""
+    # Whether the player can see their own hand
+    cheating = False
+
+    def choose_action(self, view):
+        raise NotImplementedError
 
 
 class CheatingPlayer(Player):
-    pass
+    cheating = True
+
+    def choose_action(self, view):
+        playables = []
+        useless = []
+        discardables = []
+        must_be_kept = []
+        for i, (color, number) in enumerate(view.hand):  # Note: this is cheating
+            # Note: this could be deduced from discard and played stacks
+            remaining_higher_cards_in_color = sum(1 for n in range(number + 1, NB_NUMBERS + 1) if view.count_remaining(color, n))
+            last_stack_number = view.get_last_number(color)
+            if number <= last_stack_number:
+                useless.append(i)
+            elif number == last_stack_number + 1:
+                # Note: This can be seen by player
+                higher_cards_in_other_hands = sum(1 for n in range(number + 1, NB_NUMBERS + 1) if view.count_in_other_hands(color, n))
+                succ_in_other_hands = number < NB_NUMBERS and view.count_in_other_hands(color, number + 1) > 0
+                playables.append((succ_in_other_hands, higher_cards_in_other_hands, remaining_higher_cards_in_color, i))
+            else:
+                assert number > last_stack_number + 1
+                if not all(view.count_remaining(color, n) for n in range(last_stack_number + 1, number)):
+                    useless.append(i)
+                elif view.count_remaining(color, number) > 1:
+                    # At least 1 because of the card we are considering
+                    # (and at most 2 with standard rules because the only card in more than 2 specimen
+                    # is number 1 which is always playable or useless)
+                    discardables.append((-remaining_higher_cards_in_color, -i, i))
+                else:
+                    must_be_kept.append((remaining_higher_cards_in_color, i))
+
+        # TODO: The logic between discarding and giving hints should probably
+        # be more subtle to optimise the end of games (we may want to draw or
+        # may want not to draw if the deck is getting thin).
+        if playables:
+            return Action(ActionType.PLAY, max(playables)[-1])
+        elif useless:
+            return Action(ActionType.DISCARD, min(useless))
+        elif view.hints > 0:
+            return Action(ActionType.HINT, target_player_index=(view.player_index + 1) % view.nb_player)
+        elif discardables:
+            return Action(ActionType.DISCARD, max(discardables)[-1])
+        else:
+            return Action(ActionType.DISCARD, min(must_be_kept)[-1])
 
 
 def count_cards_by_color(cards):
@@ -125,20 +198,76 @@ def count_cards_by_color(cards):
     return { k: collections.Counter(v) for k, v in color_dict.items() }
 
 
+def remove_from_count(count_by_color, card):
+    """Remove card from a count as returned by count_cards_by_color.
+
+    Numbers whose count drops to 0 are removed so that iterating over the
+    Counter only gives numbers actually available."""
+    counter = count_by_color[card.color]
+    counter[card.number] -= 1
+    if not counter[card.number]:
+        del counter[card.number]
+
+
+class GameView(object):
+    """Read-only view of a Game built once for a player at the beginning of their turn.
+
+    Colors are keys specific to the representation of the game: they are only
+    meant to be given back to the view. The hand of the player is only given
+    to cheating players."""
+    __slots__ = ("game", "player_index", "nb_player", "hints", "errors_allowed", "deck_size", "hand", "other_hands_by_color")
+
+    def __init__(self, game, player_index, cheating):
+        self.game = game
+        self.player_index = player_index
+        self.nb_player = len(game.hands)
+        self.hints = game.hints
+        self.errors_allowed = game.errors_allowed
+        self.deck_size = len(game.deck)
+        self.hand = self.get_hand(player_index) if cheating else None
+        self.other_hands_by_color = dict()
+
+    def get_hand(self, player_index):
+        """Get list of (color, number) - only for other players unless cheating."""
+        return [(c.color, c.number) for c in self.game.hands[player_index]]
+
+    def get_last_number(self, color):
+        return self.game.stacks[color].get_last_number()
+
+    def count_remaining(self, color, number):
+        """Count cards neither played nor discarded."""
+        return self.game.remaining_by_color[color][number]
+
+    def count_in_other_hands(self, color, number):
+        counter = self.other_hands_by_color.get(color)
+        if counter is None:
+            counter = self.other_hands_by_color[color] = self.game.get_other_hands_for_color(self.player_index, color)
+        return counter[number]
+
+
 class Game(object):
     MAX_NB_HINTS = 8
-    NB_CARDS_IN_HAND = 5
-
-    def __init__(self, nb_player):
+    # Number of cards in hand depending on the number of players
+    NB_CARDS_IN_HAND = {2: 5, 3: 5, 4: 4, 5: 4}
+    VIEW_CLASS = GameView
+
+    def __init__(self, nb_player, rng=random, players=None, deck=None):
+        """Create game with a deck shuffled with rng - or a copy of the cards of deck if provided."""
+        self.players = [CheatingPlayer() for _ in range(nb_player)] if players is None else players
+        self.nb_cards_in_hand = self.NB_CARDS_IN_HAND[nb_player]
         self.discard = CardContainer([])
         self.hints = self.MAX_NB_HINTS
         self.errors_allowed = 3
         self.stacks = { col: CardStack() for col in Color}
 
-        self.deck = Deck.get_deck()
-        self.hands = [Hand([self.draw_card() for _ in range(self.NB_CARDS_IN_HAND)]) for _ in range(nb_player)]
+        self.deck = Deck.get_deck(rng) if deck is None else Deck(list(deck))
+        # Cards neither played nor discarded (in deck or in hands) - updated incrementally
+        self.remaining_by_color = count_cards_by_color(self.deck)
+        self.hands = [Hand([self.draw_card() for _ in range(self.nb_cards_in_hand)]) for _ in range(nb_player)]
 
         self.remaining_turns = 100
+        # Information needed to undo moves made with make_move
+        self.undo_log = []
 
     def __str__(self):
         show_hands = True
@@ -167,7 +296,7 @@ class Game(object):
 
     def refill_hand(self, player_index):
         hand = self.hands[player_index]
-        if len(hand) < self.NB_CARDS_IN_HAND:
+        if len(hand) < self.nb_cards_in_hand:
             new_card = self.draw_card()
             if new_card is not None:
                 hand.add(new_card)
@@ -180,7 +309,16 @@ class Game(object):
         self.hints -= 1
 
     def pop_card(self, player_index, card_index):
-        return self.hands[player_index].pop(card_index)
+        card = self.hands[player_index].pop(card_index)
+        remove_from_count(self.remaining_by_color, card)
+        return card
+
+    def get_other_hands_for_color(self, player_index, color):
+        counters = [h.by_color.get(color) for i, h in enumerate(self.hands) if i != player_index]
+        counters = [c for c in counters if c]
+        if len(counters) == 1:
+            return counters[0]
+        return sum(counters, collections.Counter())
 
     def add_hint(self):
         self.hints = min(self.hints + 1, self.MAX_NB_HINTS)
@@ -213,58 +351,55 @@ class Game(object):
         self.refill_hand(player_index)
 
 
-    def play_turn(self, player_index):
-        if 0 and SHOW_PLAYER_ACTIONS:
-            print("Starting Player %d's turn" % (player_index, ))
+    def apply_action(self, player_index, action):
+        if action.type == ActionType.PLAY:
+            self.play_card(player_index, action.card_index)
+        elif action.type == ActionType.DISCARD:
+            self.discard_card(player_index, action.card_index)
+        else:
+            self.give_hints(player_index, action.target_player_index)
 
-        # Note: This can be seen by player
-        other_hands = sum((hand.cards for i, hand in enumerate(self.hands) if i != player_index), [])
-        other_hands_by_color = count_cards_by_color(other_hands)
-        # Note: this is cheating
-        all_hands = sum((hand.cards for hand in self.hands), [])
-        # Note: this could be deduced from discard and played stacks
-        remaining_by_color = count_cards_by_color(self.deck.cards + all_hands)
+    def unpop_card(self, player_index, card_index, card):
+        self.hands[player_index].insert(card_index, card)
+        counter = self.remaining_by_color[card.color]
+        counter[card.number] += 1
 
-        playables = []
-        useless = []
-        discardables = []
-        must_be_kept = []
-        for i, card in enumerate(self.hands[player_index]):  # Note: this is cheating
-            remaining_for_color = remaining_by_color[card.color]
-            remaining_higher_cards_in_color = sum(1 for n in remaining_for_color if n > card.number)
-            last_stack_number = self.stacks[card.color].get_last_number()
-            if card.number <= last_stack_number:
-                useless.append(i)
-            elif card.number == last_stack_number + 1:
-                other_hands_for_color = other_hands_by_color.get(card.color, [])
-                higher_cards_in_other_hands = sum(1 for n in other_hands_for_color if n > card.number)
-                succ_in_other_hands = (card.number + 1) in other_hands_for_color
-                playables.append((succ_in_other_hands, higher_cards_in_other_hands, remaining_higher_cards_in_color, i))
-            else:
-                assert card.number > last_stack_number + 1
-                if not all(remaining_for_color[n] for n in range(last_stack_number + 1, card.number)):
-                    useless.append(i)
-                elif remaining_for_color[card.number] > 1:
-                    # At least 1 because of the card we are considering
-                    # (and at most 2 with standard rules because the only card in more than 2 specimen
-                    # is number 1 which is always playable or useless)
-                    discardables.append((-remaining_higher_cards_in_color, -i, i))
-                else:
-                    must_be_kept.append((remaining_higher_cards_in_color, i))
+    def unplay_card(self, card):
+        self.stacks[card.color].cards.pop()
 
-        # TODO: The logic between discarding and giving hints should probably
-        # be more subtle to optimise the end of games (we may want to draw or
-        # may want not to draw if the deck is getting thin).
-        if playables:
-            self.play_card(player_index, max(playables)[-1])
-        elif useless:
-            self.discard_card(player_index, min(useless))
-        elif self.hints > 0:
-            self.give_hints(player_index, (player_index + 1) % 2)
-        elif discardables:
-            self.discard_card(player_index, max(discardables)[-1])
+    def make_move(self, player_index, action):
+        """Apply action as a whole turn of the player so that it can be undone with unmake_move.
+
+        This is meant for strategies looking ahead: it is much cheaper than copying the game."""
+        card = None if action.type == ActionType.HINT else self.hands[player_index].cards[action.card_index]
+        self.undo_log.append((player_index, action, card, len(self.deck), len(self.discard), self.hints, self.errors_allowed, self.remaining_turns))
+        self.apply_action(player_index, action)
+        self.remaining_turns = max(0, self.remaining_turns - 1)
+
+    def unmake_move(self):
+        """Undo the last move made with make_move."""
+        player_index, action, card, deck_size, discard_size, self.hints, self.errors_allowed, self.remaining_turns = self.undo_log.pop()
+        if card is None:
+            return
+        hand = self.hands[player_index]
+        if len(self.deck) < deck_size:
+            # Put the card drawn back on top of the deck
+            self.deck.add(hand.pop(len(hand) - 1))
+        if len(self.discard) > discard_size:
+            self.discard.cards.pop()
         else:
-            self.discard_card(player_index, min(must_be_kept)[-1])
+            self.unplay_card(card)
+        self.unpop_card(player_index, action.card_index, card)
+
+    def choose_action(self, player_index):
+        player = self.players[player_index]
+        return player.choose_action(self.VIEW_CLASS(self, player_index, player.cheating))
+
+    def play_turn(self, player_index):
+        if 0 and SHOW_PLAYER_ACTIONS:
+            print("Starting Player %d's turn" % (player_index, ))
+
+        self.apply_action(player_index, self.choose_action(player_index))
 
         self.remaining_turns = max(0, self.remaining_turns - 1)
         if 0 and SHOW_PLAYER_ACTIONS:
@@ -282,30 +417,979 @@ class Game(object):
         return self.get_score()
 
 
-def compare_performances():
-    before_scores = [26, 28, 24, 25, 30, 28, 25, 19, 30, 30, 29, 28, 27, 28, 22, 30, 29, 27, 27, 26, 29, 30, 30, 29, 25, 30, 27, 24, 30, 24, 27, 28, 30, 24, 24, 27, 27, 26, 29, 28, 29, 26, 30, 30, 24, 24, 29, 29, 27, 30, 28, 21, 29, 26, 30, 28, 30, 24, 30, 22, 29, 29, 27, 28, 25, 29, 27, 28, 30, 27, 26, 28, 25, 29, 26, 28, 27, 30, 29, 26, 29, 28, 27, 27, 29, 27, 28, 25, 29, 29, 28, 30, 30, 29, 27, 28, 30, 26, 28, 27, 29, 28, 30, 28, 28, 29, 29, 28, 29, 28, 26, 30, 30, 30, 30, 23, 29, 29, 25, 30, 25, 29, 30, 29, 25, 21, 30, 30, 26, 25, 28, 29, 23, 27, 29, 30, 27, 30, 30, 29, 28, 30, 30, 27, 25, 30, 30, 29, 24, 29, 30, 30, 28, 30, 30, 28, 29, 27, 25, 30, 29, 26, 28, 27, 27, 27, 30, 30, 29, 29, 26, 24, 30, 26, 29, 24, 27, 28, 25, 30, 30, 25, 26, 30, 27, 25, 29, 24, 30, 29, 26, 27, 26, 30, 26, 29, 30, 30, 27, 28, 27, 27, 28, 29, 30, 28, 29, 30, 23, 27, 25, 30, 27, 30, 28, 26, 29, 25, 26, 25, 30, 27, 25, 27, 27, 26, 30, 30, 29, 27, 29, 27, 30, 23, 29, 28, 27, 27, 25, 26, 30, 26, 28, 25, 30, 21, 30, 26, 30, 30, 28, 30, 30, 28, 28, 28, 27, 30, 24, 27, 30, 29, 28, 30, 30, 29, 23, 27, 28, 26, 30, 28, 29, 27, 27, 28, 26, 30, 27, 29, 30, 28, 29, 29, 21, 30, 30, 25, 21, 30, 20, 30, 26, 26, 30, 30, 22, 24, 26, 21, 29, 28, 26, 29, 27, 27, 27, 29, 30, 29, 28, 27, 29, 30, 29, 22, 25, 24, 30, 29, 26, 25, 30, 28, 28, 29, 30, 29, 28, 28, 28, 30, 27, 27, 30, 29, 29, 28, 28, 28, 22, 26, 26, 28, 30, 30, 29, 30, 30, 27, 30, 29, 30, 24, 29, 30, 30, 24, 29, 28, 28, 29, 27, 27, 28, 26, 29, 30, 28, 30, 30, 28, 27, 27, 30, 25, 26, 30, 30, 30, 30, 30, 29, 27, 29, 26, 29, 27, 27, 30, 28, 27, 30, 29, 29, 29, 27, 30, 29, 27, 28, 30, 30, 30, 27, 28, 29, 26, 27, 28, 30, 27, 30, 27, 29, 28, 24, 30, 27, 29, 23, 29, 23, 27, 28, 29, 24, 27, 29, 30, 30, 28, 24, 27, 29, 29, 30, 25, 25, 30, 29, 30, 26, 29, 30, 30, 29, 29, 29, 27, 30, 25, 28, 29, 28, 26, 30, 27, 30, 28, 27, 30, 27, 29, 24, 27, 29, 25, 24, 28, 30, 25, 29, 25, 29, 27, 28, 30, 30, 28, 26, 30, 27, 28, 24, 27, 29, 28, 29, 26, 25, 28, 22, 26, 26, 29, 21, 30, 27, 29, 27, 30, 27, 27, 30, 27, 27, 29, 29, 28, 22, 23, 29, 30, 25, 29, 29, 27, 30, 29, 30, 25, 30, 30, 30, 29, 27, 30, 30, 29, 29, 28, 25, 30, 28, 29, 30, 30, 25, 27, 30, 29, 30, 27, 25, 29, 28, 22, 29, 27, 30, 30, 26, 30, 27, 29, 30, 28, 30, 30, 25, 30, 24, 24, 30, 24, 29, 29, 30, 28, 26, 30, 28, 27, 22, 25, 30, 30, 30, 27, 29, 28, 27, 29, 28, 30, 29, 30, 30, 30, 28, 29, 25, 26, 26, 28, 29, 30, 27, 30, 30, 28, 27, 30, 30, 27, 28, 25, 25, 27, 26, 29, 29, 29, 28, 28, 27, 30, 26, 24, 26, 29, 27, 29, 28, 29, 24, 29, 30, 30, 24, 25, 29, 24, 30, 25, 30, 30, 29, 30, 29, 29, 26, 28, 25, 30, 24, 28, 30, 27, 29, 29, 27, 24, 30, 29, 29, 30, 26, 29, 27, 26, 27, 29, 28, 30, 30, 30, 30, 30, 30, 27, 30, 27, 28, 27, 25, 30, 28, 29, 29, 29, 29, 25, 30, 24, 30, 30, 30, 25, 25, 21, 28, 30, 26, 26, 29, 30, 25, 27, 30, 30, 30, 29, 27, 24, 28, 23, 26, 30, 30, 30, 30, 25, 29, 27, 30, 30, 28, 29, 29, 28, 30, 29, 27, 30, 23, 28, 26, 29, 25, 28, 28, 29, 29, 27, 25, 27, 26, 26, 29, 24, 25, 28, 24, 29, 29, 30, 30, 25, 29, 29, 30, 24, 30, 27, 30, 26, 30, 27, 23, 29, 28, 30, 29, 27, 26, 30, 27, 28, 30, 26, 23, 30, 30, 26, 30, 28, 29, 29, 30, 29, 29, 24, 30, 30, 27, 30, 27, 26, 25, 29, 29, 27, 24, 27, 30, 23, 30, 28, 28, 29, 30, 30, 27, 27, 27, 28, 29, 30, 25, 27, 26, 26, 29, 30, 28, 30, 28, 28, 29, 28, 25, 29, 26, 29, 30, 30, 24, 27, 30, 27, 29, 30, 28, 29, 26, 30, 26, 28, 29, 28, 30, 29, 29, 28, 29, 28, 26, 26, 27, 29, 29, 30, 28, 25, 30, 30, 30, 26, 30, 30, 30, 28, 25, 27, 28, 25, 29, 27, 29, 29, 24, 30, 30, 30, 30, 28, 28, 30, 26, 30, 28, 25, 30, 28, 27, 30, 29, 29, 26, 26, 27, 29, 30, 27, 30, 22, 27, 30, 28, 30, 26, 25, 30, 30, 30, 30, 28, 30, 25, 29, 26, 26, 29, 30, 30, 30, 28, 26, 25, 28, 26, 30, 29, 30, 30, 29, 27, 30, 29, 30, 28, 26, 30, 30, 29, 27, 28, 25, 28, 30, 30, 27, 30, 30, 27, 29, 29, 28, 30, 27, 25, 29, 30, 30, 26, 29, 26, 27, 28, 22, 27, 28, 30, 25, 28, 27, 27, 30, 30, 30, 30, 25, 30, 28, 28, 27, 30, 29, 30, 28, 28, 26, 30, 22, 30, 27, 26, 25, 30, 29, 26, 30, 28, 25, 30, 30, 29, 30, 27, 30, 25, 30, 30, 30, 30, 30, 29, 30, 29, 29, 29, 24, 29, 28, 29, 30, 30, 30, 28, 30, 29, 25, 26, 26, 26, 30, 28, 29, 29, 26, 30, 27, 29, 29, 25, 30, 27, 27, 26, 26, 29, 26, 27, 30, 26, 27, 29, 30, 29, 29, 29, 30, 27, 30, 29, 27, 29, 29, 30, 24, 30, 28, 29, 29, 25, 27, 28, 30, 25, 29, 29, 27, 28, 25, 26, 29, 20, 29, 29, 28, 29, 29, 30, 30, 28, 29, 28, 24, 29, 30, 30, 29, 30, 29, 26, 28, 29, 27, 27, 27, 27, 28, 23, 29, 30, 30, 29, 30, 30, 27, 30, 29, 30, 27, 28, 30, 30, 27, 22, 30, 27, 28, 29, 27, 30, 28, 23, 28, 27, 29, 30, 29, 25, 29, 24, 30, 27, 27, 28, 30, 20, 25, 28, 30, 30, 27, 24, 30, 29, 25, 27, 30, 29, 30, 28, 25, 26, 27, 27, 30, 29, 29, 28, 29, 28, 27, 27, 30, 27, 29, 25, 26, 29, 25, 30, 30, 29, 28, 24, 27, 30, 29, 29, 30, 29, 28, 29, 25, 26, 27, 27, 26, 27, 27, 30, 27, 27, 28, 30, 27, 30, 29, 29, 24, 30, 30, 27, 27, 30, 27, 25, 30, 28, 29, 30, 30, 27, 28, 24, 29, 30, 30, 30, 30, 28, 29, 28, 29, 24, 29, 28, 29, 30, 30, 30, 28, 29, 25, 27, 28, 29, 26, 29, 30, 29, 26, 30, 26]
+# Compact representation
+#########################################
+# Cards are small integers: color_index * 5 + number - 1 (from 0 to 29)
+# and containers are backed by bytearrays. This is meant for high-volume
+# simulations: CompactGame gives the same scores as Game for the same seed.
+
+COLORS = list(Color)
+NB_NUMBERS = 5
+NB_CARD_CODES = len(COLORS) * NB_NUMBERS
+
+
+def encode_card(number, color):
+    return COLORS.index(color) * NB_NUMBERS + number - 1
+
+
+def decode_card(code):
+    color_index, number = divmod(code, NB_NUMBERS)
+    return Card(number + 1, COLORS[color_index])
+
+
+class CompactCardContainer(object):
+    __slots__ = ("cards", )
+
+    def __init__(self, cards):
+        self.cards = bytearray(cards)
+
+    def add(self, card):
+        self.cards.append(card)
+
+    def __iter__(self):
+        return iter(self.cards)
+
+    def __len__(self):
+        return len(self.cards)
+
+    def __bool__(self):
+        return bool(self.cards)
+
+    def __str__(self):
+        return f"{','.join(str(decode_card(c)) for c in self.cards)}"
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({list(self.cards)!r})"
 
-    games = [Game(nb_player=2) for i in range(len(before_scores))]
+
+class CompactHand(CompactCardContainer):
+    __slots__ = ("counts", )
+
+    def __init__(self, cards):
+        super().__init__(cards)
+        # Number of cards in hand for each card code
+        self.counts = bytearray(NB_CARD_CODES)
+        for c in self.cards:
+            self.counts[c] += 1
+
+    def add(self, card):
+        self.cards.append(card)
+        self.counts[card] += 1
+
+    def pop(self, index):
+        card = self.cards.pop(index)
+        self.counts[card] -= 1
+        return card
+
+    def insert(self, index, card):
+        self.cards.insert(index, card)
+        self.counts[card] += 1
+
+
+class CompactDeck(CompactCardContainer):
+    __slots__ = ()
+
+    @classmethod
+    def get_deck(cls, rng=random):
+        # Same order as Deck.get_deck so that shuffling gives the same game
+        deck = []
+        for col in Color:
+            for nb, nb_card in Deck.COMPOSITION.items():
+                deck.extend([encode_card(nb, col)] * nb_card[col == Color.MULTI])
+        rng.shuffle(deck)
+        return cls(deck)
+
+    def draw_card(self):
+         return self.cards.pop()
+
+
+class CompactGameView(GameView):
+    """GameView for a CompactGame: colors are color indexes."""
+    __slots__ = ("other_hands_counts",)
+
+    def __init__(self, game, player_index, cheating):
+        super().__init__(game, player_index, cheating)
+        self.other_hands_counts = None
+
+    def get_hand(self, player_index):
+        return [(c // NB_NUMBERS, c % NB_NUMBERS + 1) for c in self.game.hands[player_index]]
+
+    def get_last_number(self, color):
+        return self.game.stacks[color]
+
+    def count_remaining(self, color, number):
+        return self.game.remaining[color * NB_NUMBERS + number - 1]
+
+    def count_in_other_hands(self, color, number):
+        # Counts for all codes are aggregated once, the first time they are needed
+        counts = self.other_hands_counts
+        if counts is None:
+            others = [h.counts for i, h in enumerate(self.game.hands) if i != self.player_index]
+            counts = self.other_hands_counts = others[0] if len(others) == 1 else [sum(c) for c in zip(*others)]
+        return counts[color * NB_NUMBERS + number - 1]
+
+
+class CompactGame(Game):
+    """Game relying on the compact representation.
+
+    Stacks are only stored as the last number played for each color index."""
+    VIEW_CLASS = CompactGameView
+
+    def __init__(self, nb_player, rng=random, players=None, deck=None):
+        self.players = [CheatingPlayer() for _ in range(nb_player)] if players is None else players
+        self.nb_cards_in_hand = self.NB_CARDS_IN_HAND[nb_player]
+        self.discard = CompactCardContainer(b"")
+        self.hints = self.MAX_NB_HINTS
+        self.errors_allowed = 3
+        self.stacks = bytearray(len(COLORS))
+
+        self.deck = CompactDeck.get_deck(rng) if deck is None else CompactDeck(deck)
+        # Number of cards neither played nor discarded for each card code
+        self.remaining = bytearray(NB_CARD_CODES)
+        for c in self.deck:
+            self.remaining[c] += 1
+        self.hands = [CompactHand([self.draw_card() for _ in range(self.nb_cards_in_hand)]) for _ in range(nb_player)]
+
+        self.remaining_turns = 100
+        self.undo_log = []
+
+    def __str__(self):
+        ret = "Hints: %s" % self.hints
+        ret += "\nErrors allowed: %s" % self.errors_allowed
+        ret += "\nScore: %d" % self.get_score()
+        ret += "\nStacks:\n\t"
+        ret += "\n\t".join(f"{col.name}: {','.join(str(Card(n, col)) for n in range(1, last + 1))}" for col, last in zip(COLORS, self.stacks))
+        ret += "\nHands:\n\t"
+        ret += "\n\t".join(str(h) for h in self.hands)
+        ret += "\nDeck:\n\t"
+        ret += str(self.deck)
+        ret += "\nDiscard:\n\t"
+        ret += str(self.discard)
+        ret += "\n\n"
+        return ret
+
+    def pop_card(self, player_index, card_index):
+        card = self.hands[player_index].pop(card_index)
+        self.remaining[card] -= 1
+        return card
+
+    def get_score(self):
+        return 0 if self.errors_allowed == 0 else sum(self.stacks)
+
+    def unpop_card(self, player_index, card_index, card):
+        self.hands[player_index].insert(card_index, card)
+        self.remaining[card] += 1
+
+    def unplay_card(self, card):
+        self.stacks[card // NB_NUMBERS] = card % NB_NUMBERS
+
+    def discard_card(self, player_index, card_index):
+        card = self.pop_card(player_index, card_index)
+        if SHOW_PLAYER_ACTIONS:
+            print("Player %d discards %s" % (player_index, decode_card(card)))
+        self.discard.add(card)
+        self.add_hint()
+        self.refill_hand(player_index)
+
+    def play_card(self, player_index, card_index):
+        card = self.pop_card(player_index, card_index)
+        if SHOW_PLAYER_ACTIONS:
+            print("Player %d plays %s" % (player_index, decode_card(card)))
+        color_index, number = divmod(card, NB_NUMBERS)
+        number += 1
+        if self.stacks[color_index] + 1 == number:
+            self.stacks[color_index] = number
+            if number == 5:
+                self.add_hint()
+        else:
+            self.discard.add(card)
+            self.errors_allowed = max(0, self.errors_allowed - 1)
+            if self.errors_allowed == 0:
+                self.remaining_turns = 0
+        self.refill_hand(player_index)
+
+
+# Optimal solver
+#########################################
+# Best score for cheating players who also know the order of the deck.
+
+# Code replacing cards which can not be played anymore: they are all equivalent
+DEAD_CARD = NB_CARD_CODES
+
+
+class SearchInterrupted(Exception):
+    pass
+
+
+class OptimalSolver(object):
+    """Find the best score reachable from the state of a CompactGame.
+
+    This is a depth-first search over the actions of all players telling
+    whether a score can be reached, with a transposition table keyed on a
+    canonical state: the order of cards in hands does not matter, cards which
+    can not be useful anymore are replaced by DEAD_CARD and hands are rotated
+    so that the current player comes first. The number of hints is not part
+    of the key: a state with more hints is at least as good, which gives
+    results for all the numbers of hints at once.
+
+    Playing a card which can not be played is never considered as discarding
+    it instead is always at least as good.
+
+    Some games need a long search to be solved: get_bounds can stop after a
+    given number of states and only give bounds of the best score."""
+
+    def __init__(self, game, player_index=0):
+        self.nb_player = len(game.hands)
+        self.errors_allowed = game.errors_allowed
+        self.max_nb_hints = game.MAX_NB_HINTS
+        # Cards in the order they are drawn
+        self.deck = bytes(reversed(game.deck.cards))
+        # first_seen[p][card]: first position of the card in the deck from position p (len(deck) if none)
+        self.first_seen = [None] * (len(self.deck) + 1)
+        next_seen = [len(self.deck)] * NB_CARD_CODES
+        for p in range(len(self.deck), -1, -1):
+            if p < len(self.deck):
+                next_seen[self.deck[p]] = p
+            self.first_seen[p] = list(next_seen)
+        self.stacks = tuple(game.stacks)
+        self.hints = game.hints
+        self.remaining_turns = game.remaining_turns
+        hands = [list(game.hands[(player_index + i) % self.nb_player]) for i in range(self.nb_player)]
+        self.hands = self.get_canonical_hands(hands, 0, self.stacks)
+        # Canonical state without hints -> ([best score reached], [lowest score not reachable]) for each number of hints
+        self.table = dict()
+        self.nb_nodes = 0
+        self.max_nb_nodes = None
+
+    def get_tops(self, hands, pos, stacks):
+        """Get highest number which may still be reached for each color."""
+        in_hands = set().union(*hands)
+        first_seen = self.first_seen[pos]
+        tops = []
+        for color_index, last in enumerate(stacks):
+            base = color_index * NB_NUMBERS
+            while last < NB_NUMBERS and (base + last in in_hands or first_seen[base + last] < len(self.deck)):
+                last += 1
+            tops.append(last)
+        return tops
+
+    def get_canonical_hands(self, hands, pos, stacks):
+        """Get tuple of sorted hands where useless cards (including copies in the same hand) are DEAD_CARD."""
+        tops = self.get_tops(hands, pos, stacks)
+        canonical_hands = []
+        for cards in hands:
+            useful = set()
+            for c in cards:
+                if c != DEAD_CARD and stacks[c // NB_NUMBERS] <= c % NB_NUMBERS < tops[c // NB_NUMBERS]:
+                    useful.add(c)
+            canonical_hands.append(tuple(sorted(useful)) + (DEAD_CARD, ) * (len(cards) - len(useful)))
+        return tuple(canonical_hands)
+
+    def get_upper_bound(self, hands, pos, stacks, turns):
+        """Upper bound of the score based on the moment cards left are drawn.
+
+        A card drawn at position q of the deck (q = pos - 1 for cards in
+        hands) can only be played after it is drawn and so can the cards
+        following it in its color: only a limited number of cards can be
+        played after position q as each play draws a card. The last card of
+        the deck can never be played."""
+        nb_cards = len(self.deck)
+        # Once the deck is empty, only the players with a turn left can play
+        in_hands = set().union(*(hands if pos < nb_cards else hands[:turns]))
+        first_seen = self.first_seen[pos]
+        # For each card which may still be played, position after which it can be played
+        playable_from = []
+        for color_index, last in enumerate(stacks):
+            base = color_index * NB_NUMBERS
+            available = pos - 1
+            for card in range(base + last, base + NB_NUMBERS):
+                if card in in_hands:
+                    q = pos - 1
+                else:
+                    q = first_seen[card]
+                    # The player drawing the last card does not play again
+                    if q >= nb_cards - 1:
+                        break
+                available = max(available, q)
+                playable_from.append(available)
+        # Keep cards from the latest ones as long as there are enough turns to play them.
+        # The number of turns left only binds once the deck is empty: drawing
+        # the last card resets it.
+        nb_playable = 0
+        for q in sorted(playable_from, reverse=True):
+            if nb_playable < nb_cards - q + self.nb_player - 2 and (pos < nb_cards or nb_playable < turns):
+                nb_playable += 1
+        return sum(stacks) + nb_playable
+
+    def get_key(self, hands, pos, stacks, turns):
+        nb_left = len(self.deck) - pos
+        # The number of turns only matters when it can end the game early:
+        # each turn either draws a card or uses a hint (at most 6 from 5s).
+        if nb_left and turns >= 2 * nb_left + self.max_nb_hints + len(COLORS) + self.nb_player:
+            turns = None
+        return hands, pos, stacks, turns
+
+    def get_moves(self, hands, pos, stacks, hints):
+        """Yield (is_play, card) with good moves first - card is None for hints."""
+        hand = hands[0]
+        cards = sorted(set(hand))
+        others = set().union(*hands[1:])
+        # Like CheatingPlayer, play cards whose next card can be played by someone else first
+        playables = [c for c in cards if c != DEAD_CARD and stacks[c // NB_NUMBERS] == c % NB_NUMBERS]
+        for c in sorted(playables, key=lambda c: c % NB_NUMBERS == NB_NUMBERS - 1 or c + 1 not in others):
+            yield True, c
+        if DEAD_CARD in cards:
+            # Discarding any other card can not be better
+            yield False, DEAD_CARD
+        if hints:
+            yield False, None
+        if DEAD_CARD not in cards:
+            # Discard cards with other copies left first, then highest numbers
+            first_seen = self.first_seen[pos]
+            for c in sorted(cards, key=lambda c: (c not in others and first_seen[c] == len(self.deck), -(c % NB_NUMBERS))):
+                yield False, c
+
+    def can_reach(self, hands, pos, stacks, hints, turns, need):
+        """Tell whether a score of at least need can be reached."""
+        if sum(stacks) >= need:
+            return True
+        self.nb_nodes += 1
+        if self.max_nb_nodes is not None and self.nb_nodes > self.max_nb_nodes:
+            raise SearchInterrupted()
+        key = self.get_key(hands, pos, stacks, turns)
+        entry = self.table.get(key)
+        if entry is None:
+            # Scores are at most NB_CARD_CODES
+            entry = self.table[key] = ([0] * (self.max_nb_hints + 1), [NB_CARD_CODES + 1] * (self.max_nb_hints + 1))
+        reached, not_reachable = entry
+        if reached[hints] >= need:
+            return True
+        if not_reachable[hints] <= need:
+            return False
+
+        upper_bound = self.get_upper_bound(hands, pos, stacks, turns)
+        result = False
+        if upper_bound >= need:
+            for is_play, card in self.get_moves(hands, pos, stacks, hints):
+                new_stacks, new_hints, new_pos, new_turns, new_hands = stacks, hints, pos, turns, hands
+                if card is None:
+                    new_hints -= 1
+                else:
+                    hand = list(hands[0])
+                    hand.remove(card)
+                    if is_play:
+                        color_index, number = divmod(card, NB_NUMBERS)
+                        new_stacks = stacks[:color_index] + (number + 1, ) + stacks[color_index + 1:]
+                        if number + 1 == NB_NUMBERS:
+                            new_hints = min(hints + 1, self.max_nb_hints)
+                    else:
+                        new_hints = min(hints + 1, self.max_nb_hints)
+                    if pos < len(self.deck):
+                        hand.append(self.deck[pos])
+                        new_pos += 1
+                        if new_pos == len(self.deck):
+                            new_turns = self.nb_player
+                    new_hands = self.get_canonical_hands([hand] + list(hands[1:]), new_pos, new_stacks)
+                new_turns = max(0, new_turns - 1)
+                if new_turns:
+                    result = self.can_reach(new_hands[1:] + new_hands[:1], new_pos, new_stacks, new_hints, new_turns, need)
+                else:
+                    result = sum(new_stacks) >= need
+                if result:
+                    break
+
+        # Reaching a score with some hints means it can be reached with more hints (and conversely)
+        if result:
+            for h in range(hints, self.max_nb_hints + 1):
+                reached[h] = max(reached[h], need)
+        else:
+            need = min(need, upper_bound + 1)
+            for h in range(hints + 1):
+                not_reachable[h] = min(not_reachable[h], need)
+        return result
+
+    def get_bounds(self, lower_bound=0, max_nodes=None):
+        """Return (lower, upper) bounds of the best score reachable.
+
+        They are equal unless the search was stopped after visiting max_nodes
+        states. lower_bound is a score known to be reachable."""
+        if not self.errors_allowed:
+            return 0, 0
+        if not self.remaining_turns:
+            return sum(self.stacks), sum(self.stacks)
+        args = (self.hands, 0, self.stacks, self.hints, self.remaining_turns)
+        lower = max(lower_bound, sum(self.stacks))
+        upper = self.get_upper_bound(self.hands, 0, self.stacks, self.remaining_turns)
+        # Searches for high scores are pruned much more but the proof that
+        # a score can not be reached may be long: try scores from the highest
+        # with a limited number of states, which is doubled on each pass.
+        limit = 1000
+        while lower < upper:
+            for need in range(upper, lower, -1):
+                self.max_nb_nodes = self.nb_nodes + limit
+                try:
+                    if self.can_reach(*args, need):
+                        lower = need
+                        break
+                    upper = need - 1
+                except SearchInterrupted:
+                    pass
+            if max_nodes is not None and self.nb_nodes >= max_nodes:
+                break
+            limit *= 2
+        self.max_nb_nodes = None
+        return lower, upper
+
+    def solve(self, lower_bound=0):
+        """Return the best score reachable."""
+        return self.get_bounds(lower_bound)[0]
+
+
+# Profiling
+#########################################
+# Instrumented subclasses of the game classes: the regular classes are left
+# untouched so that profiling costs nothing when it is not used.
+
+class GameProfiler(object):
+    """Timings and counters aggregated over the games played by classes from get_profiled_class.
+
+    Timings are inclusive: play_card and discard_card include draw_card.
+    Games can also be saved in a compact binary trace: for each game, a
+    TRACE_GAME record (number of turns, score) followed by a TRACE_TURN record
+    (player index, action, card code, hints left) for each turn."""
+    PHASES = ("choose_action", "play_card", "discard_card", "give_hints", "draw_card")
+    ACTIONS = ("play", "misplay", "discard", "hint")
+    PLAY, MISPLAY, DISCARD, HINT = range(len(ACTIONS))
+    TRACE_GAME = struct.Struct("<HB")
+    TRACE_TURN = struct.Struct("<BBBB")
+    # Card code used in the trace for hints
+    NO_CARD = 255
+
+    def __init__(self, trace=False):
+        self.times = [0.0] * len(self.PHASES)
+        self.calls = [0] * len(self.PHASES)
+        self.actions = [0] * len(self.ACTIONS)
+        self.nb_games = 0
+        self.nb_turns = 0
+        self.total_score = 0
+        self.trace = bytearray() if trace else None
+        # Turns of the game being played
+        self.game_turns = []
+
+    def record_turn(self, player_index, action, card, hints):
+        self.actions[action] += 1
+        if card is None:
+            card = self.NO_CARD
+        elif not isinstance(card, int):
+            card = encode_card(card.number, card.color)
+        self.game_turns.append((player_index, action, card, hints))
+
+    def record_game(self, score):
+        self.nb_games += 1
+        self.nb_turns += len(self.game_turns)
+        self.total_score += score
+        if self.trace is not None:
+            self.trace += self.TRACE_GAME.pack(len(self.game_turns), score)
+            for turn in self.game_turns:
+                self.trace += self.TRACE_TURN.pack(*turn)
+        self.game_turns = []
+
+    def save_trace(self, filename):
+        with open(filename, "wb") as f:
+            f.write(self.trace)
+
+    @classmethod
+    def read_trace(cls, data):
+        """Yield (score, list of turns as (player index, action, card code, hints left)) for each game."""
+        offset = 0
+        while offset < len(data):
+            nb_turns, score = cls.TRACE_GAME.unpack_from(data, offset)
+            offset += cls.TRACE_GAME.size
+            turns = [cls.TRACE_TURN.unpack_from(data, offset + i * cls.TRACE_TURN.size) for i in range(nb_turns)]
+            offset += nb_turns * cls.TRACE_TURN.size
+            yield score, turns
+
+    def print_report(self):
+        print("%d games, %d turns, avg score:%f" % (self.nb_games, self.nb_turns, self.total_score / max(self.nb_games, 1)))
+        print("Phase          Calls      Total (s)  Avg (us)")
+        for phase, calls, duration in zip(self.PHASES, self.calls, self.times):
+            print("%-13s  %9d  %9.3f  %8.2f" % (phase, calls, duration, 1e6 * duration / calls if calls else 0))
+        print("Actions: " + ", ".join("%s: %d" % item for item in zip(self.ACTIONS, self.actions)))
+
+
+def get_profiled_class(game_class, profiler):
+    """Get a subclass of game_class recording timings and actions in profiler."""
+    timer = time.perf_counter
+    times = profiler.times
+    calls = profiler.calls
+
+    def timed(phase, method):
+        index = GameProfiler.PHASES.index(phase)
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            begin = timer()
+            ret = method(self, *args, **kwargs)
+            times[index] += timer() - begin
+            calls[index] += 1
+            return ret
+        return wrapper
+
+    play_card = timed("play_card", game_class.play_card)
+    discard_card = timed("discard_card", game_class.discard_card)
+    give_hints = timed("give_hints", game_class.give_hints)
+
+    class ProfiledGame(game_class):
+        choose_action = timed("choose_action", game_class.choose_action)
+        draw_card = timed("draw_card", game_class.draw_card)
+
+        def play_card(self, player_index, card_index):
+            card = self.hands[player_index].cards[card_index]
+            discard_size = len(self.discard)
+            play_card(self, player_index, card_index)
+            action = GameProfiler.MISPLAY if len(self.discard) > discard_size else GameProfiler.PLAY
+            profiler.record_turn(player_index, action, card, self.hints)
+
+        def discard_card(self, player_index, card_index):
+            card = self.hands[player_index].cards[card_index]
+            discard_card(self, player_index, card_index)
+            profiler.record_turn(player_index, GameProfiler.DISCARD, card, self.hints)
+
+        def give_hints(self, player_index, *args, **kwargs):
+            give_hints(self, player_index, *args, **kwargs)
+            profiler.record_turn(player_index, GameProfiler.HINT, None, self.hints)
+
+        def play(self):
+            score = super().play()
+            profiler.record_game(score)
+            return score
+
+    ProfiledGame.__name__ = "Profiled" + game_class.__name__
+    return ProfiledGame
+
+
+def profile_games(nb_games=1000, nb_player=2, first_seed=0, compact=False, trace_file=None):
+    """Play games in this process with an instrumented game class and print the report."""
+    profiler = GameProfiler(trace=trace_file is not None)
+    game_class = get_profiled_class(CompactGame if compact else Game, profiler)
+    for seed in range(first_seed, first_seed + nb_games):
+        game_class(nb_player, rng=random.Random(seed)).play()
+    profiler.print_report()
+    if trace_file is not None:
+        profiler.save_trace(trace_file)
+    return profiler
+
+
+# Lockstep games
+#########################################
+# Games of CheatingPlayer played all at once with NumPy: each game is a row
+# of the arrays and each turn is a few array operations for all of them.
+# This gives the same scores as CompactGame for the same decks.
+
+# Code of empty slots in hands once the deck is empty
+EMPTY_SLOT = NB_CARD_CODES
+
+
+class LockstepGames(object):
+    """Games played by CheatingPlayer with NumPy arrays, advancing one turn for all of them at once.
+
+    CheatingPlayer only plays cards which can be played: errors are never
+    made so they are not tracked."""
+    # Priorities of the kinds of cards, cards of a kind being ordered by smaller
+    # values added to them: hints come between useless and discardable cards.
+    PLAYABLE_PRIORITY = 3000
+    USELESS_PRIORITY = 2000
+    DISCARDABLE_PRIORITY = 1000
+    MUST_BE_KEPT_PRIORITY = 0
+    EMPTY_SLOT_PRIORITY = -1000
+
+    def __init__(self, decks, nb_player=2):
+        """Create one game per compact deck (as given by get_shuffled_decks)."""
+        import numpy as np
+
+        nb_games = len(decks)
+        self.nb_player = nb_player
+        nb_cards_in_hand = Game.NB_CARDS_IN_HAND[nb_player]
+        self.rows = np.arange(nb_games)
+        # Cards in the order they are drawn
+        self.deck = np.frombuffer(b"".join(decks), dtype=np.uint8).reshape(nb_games, -1)[:, ::-1].astype(np.intp)
+        nb_dealt = nb_player * nb_cards_in_hand
+        self.deck_pos = np.full(nb_games, nb_dealt)
+        self.hands = self.deck[:, :nb_dealt].reshape(nb_games, nb_player, nb_cards_in_hand).copy()
+        # Number of cards of each code in each hand and in all hands (last column for empty slots)
+        self.hand_counts = np.zeros((nb_games, nb_player, NB_CARD_CODES + 1), dtype=np.int16)
+        for player_index in range(nb_player):
+            for slot in range(nb_cards_in_hand):
+                self.hand_counts[self.rows, player_index, self.hands[:, player_index, slot]] += 1
+        self.total_counts = self.hand_counts.sum(axis=1, dtype=np.int16)
+        # Number of cards neither played nor discarded for each card code (all decks have the same cards)
+        self.remaining = np.zeros((nb_games, NB_CARD_CODES + 1), dtype=np.int16)
+        if nb_games:
+            self.remaining[:] = np.bincount(self.deck[0], minlength=NB_CARD_CODES + 1)
+        self.stacks = np.zeros((nb_games, len(COLORS)), dtype=np.int8)
+        self.hints = np.full(nb_games, Game.MAX_NB_HINTS)
+        self.remaining_turns = np.full(nb_games, 100)
+
+        # Number of each card code, and matrices summing values of the card codes of the same
+        # color with a lower number, with a higher number, and as compared by CheatingPlayer
+        # for playable cards (100 for the next number plus 10 for each higher number).
+        self.numbers = (np.arange(NB_CARD_CODES) % NB_NUMBERS + 1).astype(np.int8)
+        same_color = np.equal.outer(np.arange(NB_CARD_CODES) // NB_NUMBERS, np.arange(NB_CARD_CODES) // NB_NUMBERS)
+        self.lower = (same_color & np.less.outer(self.numbers, self.numbers)).astype(np.float32)
+        self.higher = self.lower.T.copy()
+        self.succ_and_higher = 100 * (same_color & np.equal.outer(self.numbers, self.numbers + 1)).astype(np.float32) + 10 * self.higher
+
+    def get_card_priorities(self, player_index):
+        """Get priority of each card code (and of empty slots as last code) for the player in each game."""
+        import numpy as np
+
+        remaining = self.remaining[:, :NB_CARD_CODES]
+        left = (remaining > 0).astype(np.float32)
+        in_others = (self.total_counts[:, :NB_CARD_CODES] > self.hand_counts[:, player_index, :NB_CARD_CODES]).astype(np.float32)
+        last = np.repeat(self.stacks, NB_NUMBERS, axis=1)
+        remaining_higher = left @ self.higher
+        # Cards with a number between the stack and the card all gone
+        gone_before = ((self.numbers > last) & (left == 0)).astype(np.float32) @ self.lower
+
+        priorities = np.full((len(remaining), NB_CARD_CODES + 1), self.EMPTY_SLOT_PRIORITY, dtype=np.float32)
+        priorities[:, :NB_CARD_CODES] = np.where(
+            self.numbers == last + 1,
+            self.PLAYABLE_PRIORITY + 10 * (in_others @ self.succ_and_higher + remaining_higher),
+            np.where(remaining > 1, np.float32(self.DISCARDABLE_PRIORITY), np.float32(self.MUST_BE_KEPT_PRIORITY)) - 10 * remaining_higher)
+        np.putmask(priorities[:, :NB_CARD_CODES], (self.numbers <= last) | (gone_before > 0), self.USELESS_PRIORITY)
+        return priorities
+
+    def choose_actions(self, player_index):
+        """Return (playing, hinting, card indexes) for all games, like CheatingPlayer.choose_action."""
+        import numpy as np
+
+        hand = self.hands[:, player_index]
+        priorities = np.take_along_axis(self.get_card_priorities(player_index), hand, axis=1).astype(np.intp)
+        # Ties are broken with the highest index for playable cards, the lowest one otherwise
+        slots = np.arange(hand.shape[1])
+        priorities += np.where(priorities >= self.PLAYABLE_PRIORITY, slots, -slots)
+        card_indexes = priorities.argmax(axis=1)
+        best = priorities.max(axis=1)
+        playing = best >= self.PLAYABLE_PRIORITY
+        hinting = (best <= self.DISCARDABLE_PRIORITY) & (self.hints > 0)
+        return playing, hinting, card_indexes
+
+    def play_turn(self, player_index):
+        import numpy as np
+
+        active = self.remaining_turns > 0
+        playing, hinting, card_indexes = self.choose_actions(player_index)
+        hinting &= active
+        moving = active & ~hinting
+        rows = self.rows[moving]
+        card_indexes = card_indexes[moving]
+        hand = self.hands[rows, player_index]
+        cards = hand[np.arange(len(rows)), card_indexes]
+        color, number = np.divmod(cards, NB_NUMBERS)
+        number += 1
+
+        played = playing[moving]
+        self.stacks[rows[played], color[played]] = number[played]
+        self.hints[rows] += ~played | (number == NB_NUMBERS)
+        np.minimum(self.hints, Game.MAX_NB_HINTS, out=self.hints)
+        self.hints -= hinting
+        self.remaining[rows, cards] -= 1
+        self.hand_counts[rows, player_index, cards] -= 1
+        self.total_counts[rows, cards] -= 1
+
+        # Remove the card from the hand and draw a new one at the end
+        deck_size = self.deck.shape[1]
+        slots = np.arange(hand.shape[1])
+        hand = np.take_along_axis(hand, np.minimum(slots + (slots >= card_indexes[:, None]), len(slots) - 1), axis=1)
+        deck_pos = self.deck_pos[rows]
+        drawing = deck_pos < deck_size
+        hand[:, -1] = np.where(drawing, self.deck[rows, np.minimum(deck_pos, deck_size - 1)], EMPTY_SLOT)
+        self.hands[rows, player_index] = hand
+        rows, drawn = rows[drawing], hand[drawing, -1]
+        self.hand_counts[rows, player_index, drawn] += 1
+        self.total_counts[rows, drawn] += 1
+        self.deck_pos[rows] += 1
+        # The last card has been drawn
+        self.remaining_turns[rows[deck_pos[drawing] == deck_size - 1]] = self.nb_player
+
+        self.remaining_turns -= active
+
+    def play(self):
+        """Play all the games and return their scores as a NumPy array."""
+        player_turn = 0
+        while self.remaining_turns.any():
+            self.play_turn(player_turn)
+            player_turn = (player_turn + 1) % self.nb_player
+        return self.stacks.sum(axis=1)
+
+
+def play_lockstep_batch(seeds, nb_player=2):
+    """Play one game per seed at once with LockstepGames."""
+    return LockstepGames(get_shuffled_decks(seeds), nb_player).play().tolist()
+
+
+def play_lockstep_games(seeds, nb_player=2, nb_workers=None, batch_size=10000):
+    """Play one game per seed with LockstepGames, by batches sharded across a pool of processes.
+
+    Scores are the same as play_games, in the order of the seeds."""
+    seeds = list(seeds)
+    batches = [seeds[begin:begin + batch_size] for begin in range(0, len(seeds), batch_size)]
+    func = functools.partial(play_lockstep_batch, nb_player=nb_player)
+    return [score for scores in map_seeds(func, batches, nb_workers, chunksize=1) for score in scores]
+
+
+def play_game(seed, nb_player=2, compact=False, player_class=CheatingPlayer):
+    """Play a single game whose deck only depends on the seed provided."""
+    game_class = CompactGame if compact else Game
+    players = [player_class() for _ in range(nb_player)]
+    return game_class(nb_player, rng=random.Random(seed), players=players).play()
+
+
+def play_games(seeds, nb_player=2, nb_workers=None, chunksize=256, compact=False, player_class=CheatingPlayer):
+    """Play one game per seed, sharded across a pool of processes.
+
+    Scores are returned in the order of the seeds so that the result does
+    not depend on the number of workers (None means one per CPU)."""
+    func = functools.partial(play_game, nb_player=nb_player, compact=compact, player_class=player_class)
+    return map_seeds(func, seeds, nb_workers, chunksize)
+
+
+def map_seeds(func, seeds, nb_workers=None, chunksize=256):
+    """Call func on each seed across a pool of processes, results are in the order of the seeds."""
+    if nb_workers == 1:
+        return list(map(func, seeds))
+    with multiprocessing.Pool(nb_workers) as pool:
+        return pool.map(func, seeds, chunksize=chunksize)
+
+
+def batch_performances(nb_games=100000, nb_player=2, nb_workers=None, first_seed=0, compact=False, lockstep=False):
+    seeds = range(first_seed, first_seed + nb_games)
+    begin = time.time()
+    if lockstep:
+        scores = play_lockstep_games(seeds, nb_player, nb_workers)
+    else:
+        scores = play_games(seeds, nb_player, nb_workers, compact=compact)
+    end = time.time()
+    count = collections.Counter(scores)
+    print("Computed %d scores in %f (%f games/s)" % (nb_games, end - begin, nb_games / (end - begin)))
+    print("avg:%f, min:%d, max:%d" % (sum(scores) / len(scores), min(scores), max(scores)))
+    print("Scores:", sorted(count.items()))
+    return scores
+
+
+def get_shuffled_decks(seeds):
+    """Get compact decks shuffled like the decks of the games given by the seeds."""
+    return [bytes(CompactDeck.get_deck(random.Random(seed)).cards) for seed in seeds]
+
+
+def play_deck(deck, nb_player=2, player_class=CheatingPlayer):
+    """Play a single game with a copy of the compact deck provided."""
+    players = [player_class() for _ in range(nb_player)]
+    return CompactGame(nb_player, players=players, deck=deck).play()
+
+
+def sweep_player_counts(nb_games=10000, player_counts=(2, 3, 4, 5), first_seed=0, nb_workers=None, player_class=CheatingPlayer):
+    """Play the same decks with each number of players and compare score distributions.
+
+    Decks are shuffled once and shared by all configurations: each of them
+    plays the same games as play_game with the same seeds."""
+    decks = get_shuffled_decks(range(first_seed, first_seed + nb_games))
+    results = dict()
+    with multiprocessing.Pool(nb_workers) as pool:
+        for nb_player in player_counts:
+            func = functools.partial(play_deck, nb_player=nb_player, player_class=player_class)
+            begin = time.time()
+            scores = pool.map(func, decks, chunksize=256)
+            results[nb_player] = (scores, time.time() - begin)
+
+    print("Players  Hand  Games   avg     stdev  min  max  30 (%)  games/s")
+    for nb_player, (scores, duration) in results.items():
+        print("%7d  %4d  %5d  %6.3f  %6.3f  %3d  %3d  %6.2f  %7.0f" % (
+            nb_player, Game.NB_CARDS_IN_HAND[nb_player], len(scores),
+            statistics.mean(scores), statistics.pstdev(scores), min(scores), max(scores),
+            100 * scores.count(30) / len(scores), len(scores) / duration))
+    counts = {nb_player: collections.Counter(scores) for nb_player, (scores, _) in results.items()}
+    print("Score" + "".join("  %d players" % nb_player for nb_player in counts))
+    for score in sorted(set().union(*counts.values())):
+        print("%5d" % score + "".join("  %9d" % count[score] for count in counts.values()))
+    return results
+
+
+def compare_strategies(player_classes, nb_games=10000, nb_player=2, nb_workers=None, compact=False):
+    """Play the same games with each strategy and compare scores and speed."""
+    seeds = range(nb_games)
+    for player_class in player_classes:
+        begin = time.time()
+        scores = play_games(seeds, nb_player, nb_workers, compact=compact, player_class=player_class)
+        end = time.time()
+        print("%s: avg:%f, min:%d, max:%d (%f games/s)" % (player_class.__name__, sum(scores) / len(scores), min(scores), max(scores), nb_games / (end - begin)))
+
+
+def solve_game(seed, nb_player=2, max_nodes=None):
+    """Get score of CheatingPlayer and bounds of the best score for the game given by the seed."""
+    solver = OptimalSolver(CompactGame(nb_player, rng=random.Random(seed)))
+    score = play_game(seed, nb_player, compact=True)
+    return score, solver.get_bounds(score, max_nodes)
+
+
+def compare_with_optimal(nb_games=1000, nb_player=2, nb_workers=None, first_seed=0, max_nodes=100000):
+    """Compare scores of CheatingPlayer with the best scores reachable on the same games.
+
+    Games needing more than max_nodes states to be solved are only given bounds."""
+    seeds = range(first_seed, first_seed + nb_games)
+    func = functools.partial(solve_game, nb_player=nb_player, max_nodes=max_nodes)
     begin = time.time()
-    scores = [g.play() for g in games]
+    results = map_seeds(func, seeds, nb_workers, chunksize=1)
     end = time.time()
-    print("before_scores =", scores)
-
-    gains = []
-    losses = []
-    for i, (a, b) in enumerate(zip(before_scores, scores)):
-        if a != b:
-            d = b - a
-            if d > 0:
-                gains.append(d)
+    solved = [(score, lower) for score, (lower, upper) in results if lower == upper]
+    unsolved = [(seed, score, bounds) for seed, (score, bounds) in zip(seeds, results) if bounds[0] != bounds[1]]
+    print("Solved %d games out of %d in %f (%f games/s)" % (len(solved), nb_games, end - begin, nb_games / (end - begin)))
+    if solved:
+        print("Solved games: heuristic avg:%f, optimal avg:%f" % (sum(s for s, _ in solved) / len(solved), sum(b for _, b in solved) / len(solved)))
+        print("Gaps:", sorted(collections.Counter(b - s for s, b in solved).items()))
+    if unsolved:
+        print("Unsolved games (seed, score, bounds):", unsolved)
+    return results
+
+
+# Baseline scores
+#########################################
+# Scores of a reference strategy stored in a compact file: for each number of
+# players, a header followed by one byte per score for consecutive seeds.
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline_scores.bin")
+# Number of players, first seed, number of games
+BASELINE_HEADER = struct.Struct("<BII")
+
+
+def save_baseline(baseline, filename=BASELINE_FILE):
+    """Save baseline given as {nb_player: (first_seed, scores)}."""
+    with open(filename, "wb") as f:
+        for nb_player, (first_seed, scores) in sorted(baseline.items()):
+            f.write(BASELINE_HEADER.pack(nb_player, first_seed, len(scores)))
+            f.write(bytes(scores))
+
+
+def load_baseline(filename=BASELINE_FILE):
+    """Load baseline as {nb_player: (first_seed, scores)}."""
+    with open(filename, "rb") as f:
+        data = f.read()
+    baseline = dict()
+    offset = 0
+    while offset < len(data):
+        nb_player, first_seed, nb_games = BASELINE_HEADER.unpack_from(data, offset)
+        offset += BASELINE_HEADER.size
+        baseline[nb_player] = (first_seed, data[offset:offset + nb_games])
+        offset += nb_games
+    return baseline
+
+
+def generate_baseline(nb_games=5000, player_counts=(2, 3, 4, 5), player_class=CheatingPlayer, nb_workers=None, filename=BASELINE_FILE):
+    baseline = dict()
+    for nb_player in player_counts:
+        baseline[nb_player] = (0, play_games(range(nb_games), nb_player, nb_workers, compact=True, player_class=player_class))
+    save_baseline(baseline, filename)
+    return baseline
+
+
+def play_strategies(seed, nb_player, player_classes):
+    """Play the game given by the seed with each strategy."""
+    return tuple(play_game(seed, nb_player, compact=True, player_class=c) for c in player_classes)
+
+
+def get_confidence_interval(values, confidence=0.95):
+    """Return mean and half width of its confidence interval (normal approximation)."""
+    mean = statistics.mean(values)
+    if len(values) < 2:
+        return mean, math.inf
+    z = statistics.NormalDist().inv_cdf((1 + confidence) / 2)
+    return mean, z * statistics.stdev(values, mean) / math.sqrt(len(values))
+
+
+def compare_with_baseline(player_class=CheatingPlayer, nb_player=2, baseline_class=None, max_games=None, precision=None, confidence=0.95, batch_size=1000, nb_workers=None, filename=BASELINE_FILE):
+    """Compare a strategy with a baseline on the same seeds.
+
+    Baseline scores are read from the baseline file unless baseline_class is
+    given: both strategies are then played. Games are played by batches until
+    max_games (all the games of the baseline file by default) or, if precision
+    is given, until the difference of mean scores is known to be different
+    from 0 or to be within +/- precision with the confidence level given.
+    As the difference is then looked at after each batch, the risk (1 -
+    confidence) is split between the planned batches (Bonferroni correction)
+    and intervals are reported with the corrected confidence level."""
+    if baseline_class is None:
+        first_seed, stored_scores = load_baseline(filename)[nb_player]
+        max_games = len(stored_scores) if max_games is None else min(max_games, len(stored_scores))
+        player_classes = (player_class, )
+    else:
+        first_seed, stored_scores = 0, None
+        max_games = 10000 if max_games is None else max_games
+        player_classes = (player_class, baseline_class)
+    if max_games < 1:
+        raise ValueError("At least one game must be played")
+    if precision is not None:
+        confidence = 1 - (1 - confidence) / math.ceil(max_games / batch_size)
+    func = functools.partial(play_strategies, nb_player=nb_player, player_classes=player_classes)
+
+    scores = []
+    baseline_scores = []
+    duration = 0
+    with multiprocessing.Pool(nb_workers) as pool:
+        while len(scores) < max_games:
+            seeds = range(first_seed + len(scores), first_seed + min(len(scores) + batch_size, max_games))
+            begin = time.time()
+            results = pool.map(func, seeds, chunksize=64)
+            duration += time.time() - begin
+            scores.extend(r[0] for r in results)
+            if stored_scores is None:
+                baseline_scores.extend(r[1] for r in results)
             else:
-                losses.append(d)
-            print(i, a, b, b - a, "     >" if a > b else "             <")
-
-    print("Computed scores in %f" % (end - begin))
-    print("Before: avg:%f, min:%d, max:%d" % (sum(before_scores) / len(before_scores), min(before_scores), max(before_scores)))
-    print("After: avg:%f, min:%d, max:%d" % (sum(scores) / len(scores), min(scores), max(scores)))
-    print("Losses", min(losses) if losses else "NA", len(losses), sorted(losses))
-    print("Gains", max(gains) if gains else "NA", len(gains), sorted(gains))
-
-compare_performances()
+                baseline_scores.extend(stored_scores[s - first_seed] for s in seeds)
+            diff, diff_width = get_confidence_interval([a - b for a, b in zip(scores, baseline_scores)], confidence)
+            if precision is not None and (diff_width <= precision or abs(diff) > diff_width):
+                break
+
+    nb_games = len(scores)
+    print("%d games with %d players (seeds %d to %d) - %f games/s" % (nb_games, nb_player, first_seed, first_seed + nb_games - 1, nb_games * len(player_classes) / duration))
+    baseline_name = "Baseline" if baseline_class is None else baseline_class.__name__
+    for name, values in ((baseline_name, baseline_scores), (player_class.__name__, scores)):
+        mean, width = get_confidence_interval(values, confidence)
+        print("%s: avg:%f +/- %f, min:%d, max:%d" % (name, mean, width, min(values), max(values)))
+    print("Difference: %+f +/- %f (%g%% confidence)" % (diff, diff_width, round(confidence * 100, 4)))
+    baseline_count = collections.Counter(baseline_scores)
+    count = collections.Counter(scores)
+    print("Score  %s  %s" % (baseline_name, player_class.__name__))
+    for score in sorted(set(baseline_count) | set(count)):
+        print("%5d  %*d  %d" % (score, len(baseline_name), baseline_count[score], count[score]))
+    print("Better on %d games, worse on %d games" % (sum(a > b for a, b in zip(scores, baseline_scores)), sum(a < b for a, b in zip(scores, baseline_scores))))
+    return scores, baseline_scores
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compare CheatingPlayer with the baseline scores")
+    parser.add_argument("-players", type=int, default=2, help="Number of players")
+    parser.add_argument("-games", type=int, help="Maximum number of games (all the baseline games by default)")
+    parser.add_argument("-precision", type=float, help="Stop once the difference of mean scores is known with this precision")
+    parser.add_argument("-confidence", type=float, default=0.95, help="Confidence level")
+    parser.add_argument("-workers", type=int, help="Number of processes (one per CPU by default)")
+    parser.add_argument("-generatebaseline", action="store_true", help="Save the scores of CheatingPlayer as the new baseline")
+    parser.add_argument("-sweep", action="store_true", help="Compare scores of CheatingPlayer for 2 to 5 players")
+    parser.add_argument("-profile", action="store_true", help="Report timings and actions of games played in a single process")
+    parser.add_argument("-trace", help="File to save a binary trace of the games profiled into")
+    parser.add_argument("-lockstep", action="store_true", help="Play games in batches with NumPy and report the speed")
+    args = parser.parse_args()
+    if args.games is not None and args.games < 1:
+        parser.error("-games must be at least 1")
+
+    if args.profile:
+        profile_games(args.games or 1000, args.players, trace_file=args.trace)
+    elif args.lockstep:
+        batch_performances(args.games or 100000, args.players, args.workers, lockstep=True)
+    elif args.sweep:
+        sweep_player_counts(args.games or 10000, nb_workers=args.workers)
+    elif args.generatebaseline:
+        generate_baseline(args.games or 5000, nb_workers=args.workers)
+    else:
+        compare_with_baseline(nb_player=args.players, max_games=args.games, precision=args.precision, confidence=args.confidence, nb_workers=args.workers)
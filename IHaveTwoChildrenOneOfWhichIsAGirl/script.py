@@ -6,7 +6,86 @@ Inspired from:
  "The Boy or Girl Probability Paradox Resolved | It was never really a paradox"
 """
 
+import collections
 import itertools
+import math
+import statistics
+from fractions import Fraction
+
+
+class ProductSpace(object):
+    """Families of nb_children children drawn independently from weighted outcomes.
+
+    Families are never materialized: outcomes are grouped in classes with
+    classify(outcome) and events are predicates on the sorted tuple of the
+    classes of the children of a family, so that only multisets of classes
+    are enumerated, each with the exact Fraction weight of all the families
+    it stands for. Weights of outcomes do not need to add up to 1.
+
+    With distinct, children whose distinct(outcome) is not None must have
+    different values (like names of the girls of a family): families breaking
+    this are excluded from the space. distinct(outcome) must be None either
+    for all the outcomes of a class or for none of them."""
+
+    def __init__(self, outcomes, nb_children=2, classify=lambda outcome: outcome, distinct=None):
+        self.nb_children = nb_children
+        # Weight of each class, and weight of each class for each distinct value
+        self.weights = collections.defaultdict(Fraction)
+        weights_by_key = collections.defaultdict(lambda: collections.defaultdict(Fraction))
+        for outcome, weight in outcomes:
+            c = classify(outcome)
+            key = None if distinct is None else distinct(outcome)
+            if key is None:
+                self.weights[c] += weight
+            else:
+                weights_by_key[key][c] += weight
+        self.classes = sorted(set(self.weights) | set(c for w in weights_by_key.values() for c in w))
+        self.keyed_classes = sorted(set(c for w in weights_by_key.values() for c in w))
+        if set(self.keyed_classes) & set(self.weights):
+            raise ValueError("Outcomes of a class must all have a distinct value or none of them")
+        self.distinct_weights = self.get_distinct_weights(weights_by_key.values())
+
+    def get_distinct_weights(self, weights_by_key):
+        """Return {numbers of children of each keyed class: weight of the ways to give them distinct values}.
+
+        This is the product over the values of (1 + sum of weight * x_class), as
+        a polynomial truncated to nb_children children."""
+        index = {c: i for i, c in enumerate(self.keyed_classes)}
+        polynomial = {(0, ) * len(index): Fraction(1)}
+        for weights in weights_by_key:
+            new_polynomial = dict(polynomial)
+            for exponents, coef in polynomial.items():
+                if sum(exponents) == self.nb_children:
+                    continue
+                for c, weight in weights.items():
+                    new_exponents = list(exponents)
+                    new_exponents[index[c]] += 1
+                    new_exponents = tuple(new_exponents)
+                    new_polynomial[new_exponents] = new_polynomial.get(new_exponents, 0) + coef * weight
+            polynomial = new_polynomial
+        return polynomial
+
+    def families(self):
+        """Generate (sorted tuple of the classes of the children, weight of the families) lazily."""
+        for family in itertools.combinations_with_replacement(self.classes, self.nb_children):
+            counts = collections.Counter(family)
+            # Number of orders of the children, keyed classes being ordered by the polynomial
+            weight = Fraction(math.factorial(self.nb_children))
+            for c, count in counts.items():
+                if c in self.weights:
+                    weight *= self.weights[c] ** count / math.factorial(count)
+            if self.keyed_classes:
+                weight *= self.distinct_weights.get(tuple(counts[c] for c in self.keyed_classes), 0)
+            if weight:
+                yield family, weight
+
+    def weight(self, event=lambda family: True):
+        """Return the total weight of the families for which event is true."""
+        return sum((weight for family, weight in self.families() if event(family)), Fraction(0))
+
+    def probability(self, event, given=lambda family: True):
+        """Return the exact probability of event given the other event as a Fraction."""
+        return self.weight(lambda family: event(family) and given(family)) / self.weight(given)
 
 
 genders = ['boy', 'girl']
@@ -19,94 +98,157 @@ girl_names = [
     ('linda', 40),
 ]
 
+# Number of families simulated to cross-check exact results (0 to skip).
+# Simulations need NumPy: set it to 10 ** 6 for instance to enable them.
+nb_simulated_families = 0
 
 
-def part1():
+
+def part1(nb_children=2):
     """ Someone says: "I have two children, at least one of which
     is a girl." - what is the probablity that the other is a girl
     as well ? (from 0:40 on the video) """
 
     # Generate universe
-    universe = list(itertools.product(genders, repeat=2))
+    universe = ProductSpace([(gender, 1) for gender in genders], nb_children)
 
     # Generate sub-universes
-    at_least_1_girl = [l for l in universe if any(e == 'girl' for e in l)]
-    exactly_2_girls = [l for l in universe if all(e == 'girl' for e in l)]
+    at_least_1_girl = lambda family: 'girl' in family
+    only_girls = lambda family: all(e == 'girl' for e in family)
 
     # Compute probability
-    ret = len(exactly_2_girls) / len(at_least_1_girl)
+    ret = universe.probability(only_girls, given=at_least_1_girl)
     print("part1 -> ", ret)
     return ret
 
 
 
-def part2(name='julie'):
+def part2(name='julie', nb_children=2):
     """ Someone says: "I have two children, at least one of which
     is a girl, whose name is Julie." - what is the probability that
     the other is a girl as well ? (from 2:40 on the video) """
 
-    # Generate girl universe
-    ratio = 10
-    girls = []
-    for (nam, proba) in girl_names:
-        girls.extend([('girl', nam)] * (proba // ratio))
-
-    # Generate boy universe
-    boys = [('boy', 'whocares')] * len(girls)
-
-    # Generate universe which is assumed not to have duplicated names
-    return # TODO: This filtering seems to be pretty wrong
-    universe = list(itertools.product(boys + girls, repeat=2))
-    universe = [l for l in universe if len(set(e[1] for e in l)) == len(l)]
+    # Generate universe: as many boys as girls, girls with the weights of their names
+    total = sum(proba for (nam, proba) in girl_names)
+    kids = [(('boy', None), Fraction(1, 2))]
+    kids.extend((('girl', nam), Fraction(proba, 2 * total)) for (nam, proba) in girl_names)
+    classify = lambda kid: (kid[0], kid[1] == name)
 
     # Check basics from previous step
-    at_least_1_girl = [l for l in universe if any(e[0] == 'girl' for e in l)]
-    exactly_2_girls = [l for l in universe if all(e[0] == 'girl' for e in l)]
-    step1 = len(exactly_2_girls) / len(at_least_1_girl)
-    assert step1 == 1/3
+    universe = ProductSpace(kids, nb_children, classify)
+    at_least_1_girl = lambda family: any(e[0] == 'girl' for e in family)
+    only_girls = lambda family: all(e[0] == 'girl' for e in family)
+    step1 = universe.probability(only_girls, given=at_least_1_girl)
+    assert step1 == Fraction(1, 2 ** nb_children - 1)
 
-    # Generate sub-universes
-    at_least_1_girl_whose_name =       [l for l in universe if any(e[0] == 'girl' and e[1] == name for e in l)]
-    exactly_2_girls_and_1_whose_name = [l for l in universe if any(e[0] == 'girl' and e[1] == name for e in l) and all(e[0] == 'girl' for e in l)]
+    # Generate universe which is assumed not to have girls with the same name
+    universe = ProductSpace(kids, nb_children, classify, distinct=lambda kid: kid[1])
 
-    # Check a few values ?
-    # print(len(universe))
-    # print(len(at_least_1_girl_whose_name), len(at_least_1_girl))
-    # print(len(exactly_2_girls_and_1_whose_name), len(exactly_2_girls))
+    # Generate sub-universes
+    at_least_1_girl_whose_name = lambda family: ('girl', True) in family
 
     # Compute probability
-    ret = len(exactly_2_girls_and_1_whose_name) / len(at_least_1_girl_whose_name)
+    ret = universe.probability(only_girls, given=at_least_1_girl_whose_name)
     print("part2 (", name, ") ->", ret)
     return ret
 
 
-def part3(day=2):
+def part3(day=2, nb_children=2, nb_days=7):
     """ Someone says: "I have two children, at least one of which
     is a girl, who was born on a Tuesday." - what is the probability
 	that the other is a girl as well ? (from 8:17 on the video) """
 
     # Generate universe
-    kids = [(gender, day) for gender in genders for day in range(7)]
-    universe = list(itertools.product(kids, repeat=2))
+    kids = [((gender, d), 1) for gender in genders for d in range(nb_days)]
+    universe = ProductSpace(kids, nb_children, classify=lambda kid: (kid[0], kid[1] == day))
 
     # Check basics from previous step
-    at_least_1_girl = [l for l in universe if any(e[0] == 'girl' for e in l)]
-    exactly_2_girls = [l for l in universe if all(e[0] == 'girl' for e in l)]
-    step1 = len(exactly_2_girls) / len(at_least_1_girl)
-    assert step1 == 1/3
+    at_least_1_girl = lambda family: any(e[0] == 'girl' for e in family)
+    only_girls = lambda family: all(e[0] == 'girl' for e in family)
+    step1 = universe.probability(only_girls, given=at_least_1_girl)
+    assert step1 == Fraction(1, 2 ** nb_children - 1)
 
     # Generate sub-universes
-    at_least_1_girl_whose_birthday =     [l for l in universe if any(e[0] == 'girl' and e[1] == day for e in l)]
-    exactly_2_girls_and_1_whose_birday = [l for l in universe if any(e[0] == 'girl' and e[1] == day for e in l) and all(e[0] == 'girl' for e in l)]
+    at_least_1_girl_whose_birthday = lambda family: ('girl', True) in family
 
     # Compute probability
-    ret = len(exactly_2_girls_and_1_whose_birday) / len(at_least_1_girl_whose_birthday)
+    ret = universe.probability(only_girls, given=at_least_1_girl_whose_birthday)
     print("part3 (", day, ") ->", ret)
     return ret
 
 
 
-print(part1() == 1/3)
+def simulate(event, given, nb_families=10 ** 6, nb_children=2, gender_weights=(1, 1), name_weights=None, day_weights=(1, ) * 7,
+             batch_size=10 ** 5, confidence=0.95, seed=None):
+    """ Estimate the probability of event given the other event on random
+    families, simulated by batches with NumPy.
+
+    Children get a gender with gender_weights (boy, girl), a day with
+    day_weights and a name index with name_weights (the weights of
+    girl_names by default). Events get arrays (girls, names, days) of
+    shape (families, children) and return a boolean array of families.
+    Return (estimate, half width of the confidence interval, number of
+    families for which given is true) - (nan, inf, 0) if there are none. """
+    import numpy as np
+
+    if name_weights is None:
+        name_weights = [proba for (nam, proba) in girl_names]
+    rng = np.random.default_rng(seed)
+    girl_proba = gender_weights[1] / sum(gender_weights)
+    name_probas = np.array(name_weights) / sum(name_weights)
+    day_probas = np.array(day_weights) / sum(day_weights)
+    nb_given = nb_both = 0
+    for begin in range(0, nb_families, batch_size):
+        shape = (min(batch_size, nb_families - begin), nb_children)
+        girls = rng.random(shape) < girl_proba
+        names = rng.choice(len(name_probas), size=shape, p=name_probas)
+        days = rng.choice(len(day_probas), size=shape, p=day_probas)
+        kept = given(girls, names, days)
+        nb_given += int(kept.sum())
+        nb_both += int((kept & event(girls, names, days)).sum())
+    if not nb_given:
+        return math.nan, math.inf, 0
+    estimate = nb_both / nb_given
+    z = statistics.NormalDist().inv_cdf((1 + confidence) / 2)
+    return estimate, z * math.sqrt(estimate * (1 - estimate) / nb_given), nb_given
+
+
+def have_distinct_girl_names(girls, names):
+    """ Tell for each family whether its girls all have different names. """
+    import numpy as np
+
+    # Boys get different negative names so that only girls can share a name
+    names = np.sort(np.where(girls, names, -1 - np.arange(names.shape[1])), axis=1)
+    return (names[:, 1:] != names[:, :-1]).all(axis=1)
+
+
+def simulate_parts(name='julie', day=2, nb_families=10 ** 6, **kwargs):
+    """ Estimate the probabilities of part1, part2 and part3 with simulate -
+    kwargs are given to simulate to change the number of children or the
+    distributions. Return {part: (estimate, half width, number of families)}. """
+    name_index = [nam for (nam, proba) in girl_names].index(name)
+    only_girls = lambda girls, names, days: girls.all(axis=1)
+    questions = {
+        "part1": lambda girls, names, days: girls.any(axis=1),
+        "part2": lambda girls, names, days: (girls & (names == name_index)).any(axis=1) & have_distinct_girl_names(girls, names),
+        "part3": lambda girls, names, days: (girls & (days == day)).any(axis=1),
+    }
+    ret = dict()
+    for part, given in questions.items():
+        estimate, half_width, nb_given = ret[part] = simulate(only_girls, given, nb_families, **kwargs)
+        print("%s simulated -> %.5f +/- %.5f (%d families)" % (part, estimate, half_width, nb_given))
+    return ret
+
+
+print(part1() == Fraction(1, 3))
 for (nam, proba) in girl_names:
-    print(part2(nam) == 1/2)
-print(part3() == 13/27)
+    # Close to 1/2 for rare names
+    share = Fraction(proba, sum(p for (n, p) in girl_names))
+    print(part2(nam) == (1 - share) / (2 - share))
+print(part3() == Fraction(13, 27))
+
+if nb_simulated_families:
+    # Exact results should be in the confidence intervals (95% of the time)
+    exact = {"part1": part1(), "part2": part2(), "part3": part3()}
+    for part, (estimate, half_width, nb_given) in simulate_parts(nb_families=nb_simulated_families).items():
+        print(part, abs(estimate - exact[part]) <= half_width)
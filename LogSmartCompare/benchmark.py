@@ -0,0 +1,255 @@
+"""
+Benchmark for log_smart_compare: measure throughput of each phase for each log format.
+Log files are generated randomly based on the examples from log_smart_compare, with a
+configurable number of lines and number of distinct values for each group key (cardinality).
+
+For each phase and format, the number of lines per second, the peak RSS of the process
+and the number of bytes written are reported. Results can be saved as JSON to compare runs.
+"""
+
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import random
+import re
+import resource
+import shutil
+import tempfile
+import time
+
+import log_smart_compare
+
+
+def generate_ulogcat_line(rng, i, cardinality):
+    n = rng.randrange(cardinality)
+    process = "" if n % 3 == 0 else "aap%d-%d/" % (n, 4000 + n)
+    return "03-23 15:39:%02d.%03d %s %-11s (%sreaderThread%d-%d)   : Message number %d" % (
+        i // 1000 % 60,
+        i % 1000,
+        rng.choice("DIWE"),
+        "SENSORSSVC%d" % rng.randrange(cardinality),
+        process,
+        n,
+        5000 + n,
+        i,
+    )
+
+
+def generate_logcat_line(rng, i, cardinality):
+    n = rng.randrange(cardinality)
+    return "03-24 08:36:%02d.%03d  %d  %d %s PM_AapThread%d: Message number %d" % (
+        i // 1000 % 60,
+        i % 1000,
+        4000 + n,
+        5000 + rng.randrange(cardinality),
+        rng.choice("DIWE"),
+        n,
+        i,
+    )
+
+
+def generate_dmesg_line(rng, i, cardinality):
+    return "[%d.%06d] usb 1-%d: Message number %d" % (
+        43189 + i // 1000,
+        i % 1000,
+        rng.randrange(cardinality),
+        i,
+    )
+
+
+LINE_GENERATORS = {
+    "ulogcat": generate_ulogcat_line,
+    "logcat": generate_logcat_line,
+    "dmesg": generate_dmesg_line,
+}
+
+
+def generate_lines(log_format, nb_lines, cardinality=10, seed=0):
+    rng = random.Random(seed)
+    generate_line = LINE_GENERATORS[log_format]
+    for i in range(nb_lines):
+        yield generate_line(rng, i, cardinality)
+
+
+def write_log_file(directory, log_format, nb_lines, cardinality):
+    filename = os.path.join(directory, "%s.log" % log_format)
+    with open(filename, "w", encoding=log_smart_compare.ENCODING) as f:
+        for line in generate_lines(log_format, nb_lines, cardinality):
+            f.write(line + "\n")
+    return filename
+
+
+def get_legacy_line_parser(log_config):
+    """Get line parser working like the first versions of extract_data, for comparison."""
+    log_re, out_format = log_config
+
+    def parse_line(line):
+        m = re.match(log_re, line)
+        if m is None:
+            return None, None
+        d = m.groupdict()
+        return d, out_format.format(**d)
+
+    return parse_line
+
+
+def get_dir_size(directory):
+    return sum(
+        os.path.getsize(os.path.join(root, filename))
+        for root, _, filenames in os.walk(directory)
+        for filename in filenames
+    )
+
+
+# Phases: function(filename, log_config, group_keys) returning the number of
+# bytes written. Each of them is run in its own process to measure its peak RSS.
+
+
+def run_legacy_parse_phase(filename, log_config, group_keys):
+    parse_line = get_legacy_line_parser(log_config)
+    with open(filename, encoding=log_smart_compare.ENCODING) as f:
+        for line in f:
+            parse_line(line.strip())
+    return 0
+
+
+def run_parse_phase(filename, log_config, group_keys):
+    for _ in log_smart_compare.parse_lines(log_smart_compare.LogFile(filename), log_config):
+        pass
+    return 0
+
+
+def run_extract_phase(filename, log_config, group_keys):
+    log_smart_compare.extract_data(log_smart_compare.LogFile(filename), log_config)
+    return 0
+
+
+def run_store_phase(filename, log_config, group_keys):
+    tmpdir = log_smart_compare.store_relevant_data_in_a_tmp_folder(
+        log_smart_compare.LogFile(filename), log_config, group_keys
+    )
+    size = get_dir_size(tmpdir)
+    shutil.rmtree(tmpdir)
+    return size
+
+
+def run_stream_phase(filename, log_config, group_keys):
+    tmpdir = log_smart_compare.stream_relevant_data_in_a_tmp_folder(
+        log_smart_compare.LogFile(filename), log_config, group_keys
+    )
+    size = get_dir_size(tmpdir)
+    shutil.rmtree(tmpdir)
+    return size
+
+
+PHASES = {
+    "legacy_parse": run_legacy_parse_phase,
+    "parse": run_parse_phase,
+    "extract": run_extract_phase,
+    "store": run_store_phase,
+    "stream": run_stream_phase,
+}
+
+
+def measure_phase(phase, filename, log_format, group_keys):
+    """Run phase on file - return (duration in seconds, peak RSS in bytes, bytes written)."""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        begin = time.perf_counter()
+        bytes_written = PHASES[phase](
+            filename, log_smart_compare.LOG_CONFIGS[log_format], group_keys
+        )
+        duration = time.perf_counter() - begin
+    # ru_maxrss is in kilobytes on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return duration, peak_rss, bytes_written
+
+
+def run_benchmark(nb_lines, cardinality, formats, phases, group_keys):
+    results = []
+    # A new process for each measure so that peak RSS is not shared
+    context = multiprocessing.get_context("spawn")
+    directory = tempfile.mkdtemp()
+    try:
+        for log_format in formats:
+            filename = write_log_file(directory, log_format, nb_lines, cardinality)
+            for phase in phases:
+                with context.Pool(1, maxtasksperchild=1) as pool:
+                    duration, peak_rss, bytes_written = pool.apply(
+                        measure_phase, (phase, filename, log_format, group_keys)
+                    )
+                result = {
+                    "format": log_format,
+                    "phase": phase,
+                    "lines": nb_lines,
+                    "seconds": duration,
+                    "lines_per_second": nb_lines / duration,
+                    "peak_rss": peak_rss,
+                    "bytes_written": bytes_written,
+                }
+                print(
+                    "%-8s %-13s %10d lines/s  peak RSS: %8.1f MB  written: %8.1f MB"
+                    % (
+                        log_format,
+                        phase,
+                        result["lines_per_second"],
+                        peak_rss / 1e6,
+                        bytes_written / 1e6,
+                    )
+                )
+                results.append(result)
+    finally:
+        shutil.rmtree(directory)
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-lines", type=int, default=200000, help="Number of lines per format")
+    parser.add_argument(
+        "-cardinality",
+        type=int,
+        default=10,
+        help="Number of distinct values for each group key",
+    )
+    parser.add_argument(
+        "-format",
+        action="append",
+        choices=log_smart_compare.LOG_CONFIGS.keys(),
+        help="Log formats to benchmark (all by default)",
+    )
+    parser.add_argument(
+        "-phase",
+        action="append",
+        choices=PHASES.keys(),
+        help="Phases to benchmark (all by default)",
+    )
+    parser.add_argument("-output", help="JSON file to save results into")
+    args = parser.parse_args()
+
+    group_keys = log_smart_compare.DEFAULT_GROUP_KEYS
+    results = run_benchmark(
+        args.lines,
+        args.cardinality,
+        args.format or list(log_smart_compare.LOG_CONFIGS),
+        args.phase or list(PHASES),
+        group_keys,
+    )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                    "lines": args.lines,
+                    "cardinality": args.cardinality,
+                    "group_keys": group_keys,
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
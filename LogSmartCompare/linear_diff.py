@@ -0,0 +1,189 @@
+"""
+Diff between sequences of lines based on the linear space variant of Myers' algorithm
+("An O(ND) Difference Algorithm and Its Variations", Eugene W. Myers, 1986).
+
+Memory used is linear in the size of the inputs, unlike difflib which may use much more
+on big inputs, and the output has the same shape as difflib's (opcodes and unified diff).
+Like GNU diff, the search gives up on ranges which are too different, which are then
+reported as replaced as a whole: the diff may not be minimal but the time is bounded.
+"""
+
+# Minimum cost (number of edits looked at from each end) before giving up on a range
+MIN_COST_LIMIT = 256
+
+
+def get_cost_limit(n, m):
+    """Get cost after which the search of a middle snake gives up, for inputs of sizes n and m.
+
+    Like GNU diff's heuristic, it is about the square root of the size of the inputs."""
+    return max(MIN_COST_LIMIT, 1 << ((n + m).bit_length() // 2))
+
+
+def find_middle_snake(a, a0, n, b, b0, m, cost_limit=None):
+    """Find the middle snake of an optimal path between a[a0:a0+n] and b[b0:b0+m].
+
+    Return (x, y, u, v) so that a[a0+x:a0+u] == b[b0+y:b0+v] is on an optimal path,
+    or None if more than cost_limit edits are needed from each end."""
+    delta = n - m
+    odd = delta % 2
+    max_d = (n + m + 1) // 2
+    if cost_limit is not None and cost_limit < max_d:
+        max_d = cost_limit
+    offset = max_d + 1
+    # Furthest x reached on each diagonal k (stored at k + offset), forward and backward
+    forward = [0] * (2 * offset + 1)
+    backward = [0] * (2 * offset + 1)
+    for d in range(max_d + 1):
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and forward[offset + k - 1] < forward[offset + k + 1]):
+                x = forward[offset + k + 1]
+            else:
+                x = forward[offset + k - 1] + 1
+            y = x - k
+            x0, y0 = x, y
+            while x < n and y < m and a[a0 + x] == b[b0 + y]:
+                x += 1
+                y += 1
+            forward[offset + k] = x
+            if odd and delta - d < k < delta + d and x + backward[offset + delta - k] >= n:
+                return x0, y0, x, y
+        # Backward paths work on reversed sequences: diagonal k here is delta - k forward
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and backward[offset + k - 1] < backward[offset + k + 1]):
+                x = backward[offset + k + 1]
+            else:
+                x = backward[offset + k - 1] + 1
+            y = x - k
+            x0, y0 = x, y
+            while x < n and y < m and a[a0 + n - x - 1] == b[b0 + m - y - 1]:
+                x += 1
+                y += 1
+            backward[offset + k] = x
+            if not odd and -d <= delta - k <= d and x + forward[offset + delta - k] >= n:
+                return n - x, m - y, n - x0, m - y0
+    if max_d < (n + m + 1) // 2:
+        return None
+    raise AssertionError("No middle snake found")
+
+
+def get_matching_blocks(a, b):
+    """Return list of triples (i, j, size) such that a[i:i+size] == b[j:j+size].
+
+    Like difflib.SequenceMatcher.get_matching_blocks, the last triple is (len(a), len(b), 0)."""
+    blocks = []
+    cost_limit = get_cost_limit(len(a), len(b))
+    # Explicit stack of (a0, a1, b0, b1) to process, last one being processed first
+    stack = [(0, len(a), 0, len(b))]
+    while stack:
+        a0, a1, b0, b1 = stack.pop()
+        # Common prefix and suffix
+        i = 0
+        while a0 + i < a1 and b0 + i < b1 and a[a0 + i] == b[b0 + i]:
+            i += 1
+        if i:
+            blocks.append((a0, b0, i))
+            a0 += i
+            b0 += i
+        j = 0
+        while a0 < a1 - j and b0 < b1 - j and a[a1 - j - 1] == b[b1 - j - 1]:
+            j += 1
+        if a0 < a1 - j and b0 < b1 - j and not set(a[a0:a1 - j]).isdisjoint(b[b0:b1 - j]):
+            # Both sides are non-empty, share lines and differ at both ends: at least 2 edits
+            snake = find_middle_snake(a, a0, a1 - j - a0, b, b0, b1 - j - b0, cost_limit)
+        else:
+            snake = None
+        if snake is not None:
+            x, y, u, v = snake
+            if u > x:
+                blocks.append((a0 + x, b0 + y, u - x))
+            stack.append((a0 + u, a1 - j, b0 + v, b1 - j))
+            stack.append((a0, a0 + x, b0, b0 + y))
+        if j:
+            blocks.append((a1 - j, b1 - j, j))
+    # Sort and merge adjacent blocks
+    merged = []
+    for i, j, size in sorted(blocks):
+        if merged and merged[-1][0] + merged[-1][2] == i and merged[-1][1] + merged[-1][2] == j:
+            merged[-1] = (merged[-1][0], merged[-1][1], merged[-1][2] + size)
+        else:
+            merged.append((i, j, size))
+    merged.append((len(a), len(b), 0))
+    return merged
+
+
+def get_opcodes(a, b):
+    """Return list of 5-tuples describing how to turn a into b, like difflib.SequenceMatcher.get_opcodes."""
+    opcodes = []
+    i = j = 0
+    for ai, bj, size in get_matching_blocks(a, b):
+        tag = ""
+        if i < ai and j < bj:
+            tag = "replace"
+        elif i < ai:
+            tag = "delete"
+        elif j < bj:
+            tag = "insert"
+        if tag:
+            opcodes.append((tag, i, ai, j, bj))
+        i, j = ai + size, bj + size
+        if size:
+            opcodes.append(("equal", ai, i, bj, j))
+    return opcodes
+
+
+def get_grouped_opcodes(opcodes, n=3):
+    """Group opcodes into hunks with up to n lines of context, like difflib.SequenceMatcher.get_grouped_opcodes."""
+    if not opcodes:
+        opcodes = [("equal", 0, 1, 0, 1)]
+    # Fixup leading and trailing groups if they show no changes
+    if opcodes[0][0] == "equal":
+        tag, i1, i2, j1, j2 = opcodes[0]
+        opcodes[0] = tag, max(i1, i2 - n), i2, max(j1, j2 - n), j2
+    if opcodes[-1][0] == "equal":
+        tag, i1, i2, j1, j2 = opcodes[-1]
+        opcodes[-1] = tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)
+    group = []
+    for tag, i1, i2, j1, j2 in opcodes:
+        # End the current group and start a new one whenever there is a large range with no changes
+        if tag == "equal" and i2 - i1 > 2 * n:
+            group.append((tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)))
+            yield group
+            group = []
+            i1, j1 = max(i1, i2 - n), max(j1, j2 - n)
+        group.append((tag, i1, i2, j1, j2))
+    if group and not (len(group) == 1 and group[0][0] == "equal"):
+        yield group
+
+
+def format_range(start, stop):
+    """Convert a range to the "ed" format used by unified diffs."""
+    beginning = start + 1  # lines start numbering with one
+    length = stop - start
+    if length == 1:
+        return "%d" % beginning
+    if not length:
+        beginning -= 1  # empty ranges begin at line just before the range
+    return "%d,%d" % (beginning, length)
+
+
+def unified_diff(a, b, fromfile="", tofile="", n=3):
+    """Generate lines of the unified diff between a and b (without line terminators)."""
+    started = False
+    for group in get_grouped_opcodes(get_opcodes(a, b), n):
+        if not started:
+            started = True
+            yield "--- %s" % fromfile
+            yield "+++ %s" % tofile
+        first, last = group[0], group[-1]
+        yield "@@ -%s +%s @@" % (format_range(first[1], last[2]), format_range(first[3], last[4]))
+        for tag, i1, i2, j1, j2 in group:
+            if tag == "equal":
+                for line in a[i1:i2]:
+                    yield " " + line
+                continue
+            if tag in ("replace", "delete"):
+                for line in a[i1:i2]:
+                    yield "-" + line
+            if tag in ("replace", "insert"):
+                for line in b[j1:j2]:
+                    yield "+" + line
@@ -11,6 +11,17 @@ import re
 import tempfile
 import os
 import subprocess
+import io
+import gzip
+import string
+import collections
+import functools
+import multiprocessing
+import shutil
+import hashlib
+import pickle
+
+import linear_diff
 
 # ULOGCAT FORMAT
 #########################################
@@ -71,61 +82,684 @@ LOG_CONFIGS = {
 }
 
 
+# LINE PARSERS
+#########################################
+# A line parser takes a stripped line and returns (groups, output line) where
+# groups is the tuple of values for get_group_names(regexp), both being None
+# if the line does not match.
+
+
+def get_group_names(log_re):
+    """Get names of the groups from the regexp, in the order of the groups.
+
+    All groups must be named, other ones being non-capturing (?:...), so that
+    the position of a name is the position of its value in match.groups()."""
+    if log_re.groups != len(log_re.groupindex):
+        raise ValueError(
+            "Regexp %r has unnamed groups: use (?:...) for them" % log_re.pattern
+        )
+    return tuple(sorted(log_re.groupindex, key=log_re.groupindex.get))
+
+
+def get_positional_format(log_config):
+    """Convert output format using group names into a format using group positions.
+
+    Formatting a tuple of groups then avoids building a dictionnary for each line."""
+    log_re, out_format = log_config
+    group_names = get_group_names(log_re)
+    ret = ""
+    for literal, field, spec, conversion in string.Formatter().parse(out_format):
+        ret += literal.replace("{", "{{").replace("}", "}}")
+        if field is not None:
+            ret += "{%d%s%s}" % (
+                group_names.index(field),
+                "!" + conversion if conversion else "",
+                ":" + spec if spec else "",
+            )
+    return ret
+
+
+def get_line_parser(log_config):
+    """Get line parser for the log configuration."""
+    log_re, _ = log_config
+    match = log_re.match
+    positional_format = get_positional_format(log_config)
+    single_field = re.fullmatch(r"\{(\d+)\}", positional_format)
+    if single_field:
+        # Output line is one of the groups: no formatting needed
+        index = int(single_field.group(1))
+        out_format = lambda *groups: groups[index]
+    else:
+        out_format = positional_format.format
+
+    def parse_line(line):
+        m = match(line)
+        if m is None:
+            return None, None
+        groups = m.groups()
+        return groups, out_format(*groups)
+
+    return parse_line
+
+
+# Keys used to group lines by default
+DEFAULT_GROUP_KEYS = [
+    "tag",
+    "threadname",
+    "threadid",
+    "level",
+    "processname",
+    "processid",
+    "ALL",
+]
+# Maximum number of output files kept open at the same time in streaming mode
+MAX_OPEN_FILES = 256
+# Buffer size for each of these files
+OUTPUT_BUFFER_SIZE = 64 * 1024
+# Size of the chunks files are split into when processed in parallel
+CHUNK_SIZE = 64 * 1024 * 1024
+# Encoding of the input files
+ENCODING = "ISO-8859-1"
+# Value of -difftool to compare data with the built-in diff instead of an external tool
+BUILTIN_DIFFTOOL = "builtin"
+# Groups (key, value) of raw lines only counted by the built-in diff: timestamps
+# and the like make all their lines differ between captures
+COUNTED_ONLY_GROUPS = {("ALL", "original"), ("ALL", "nomatch")}
+# Cache of extracted data: location, maximum size in bytes and version of the
+# data stored (to be increased whenever extract_data changes its output)
+CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+    "log_smart_compare",
+)
+CACHE_MAX_SIZE = 1024 * 1024 * 1024
+CACHE_VERSION = 1
+
+
+class LogFile(object):
+    """Input file iterated as text lines.
+
+    Files ending with .gz or .zst are decompressed on the fly (the latter
+    requires the zstandard module) and "-" is the standard input. Pipes such
+    as process substitutions are accepted too. For regular files, iteration
+    can be limited to the line-aligned byte range [begin, end).
+    """
+
+    def __init__(self, filename, begin=0, end=None):
+        if filename != "-" and (
+            os.path.isdir(filename) or not os.access(filename, os.R_OK)
+        ):
+            raise ValueError("%s is not a readable file" % filename)
+        self.filename = filename
+        self.begin = begin
+        self.end = end
+        self.name = filename if end is None else "%s[%d:%d]" % (filename, begin, end)
+
+    def is_compressed(self):
+        return self.filename.endswith((".gz", ".zst"))
+
+    def is_stream(self):
+        """Return whether the file can only be read once from the start (standard input, pipes)."""
+        return self.filename == "-" or not os.path.isfile(self.filename)
+
+    def open_binary(self):
+        if self.filename == "-":
+            return open(sys.stdin.fileno(), "rb", closefd=False)
+        if self.filename.endswith(".gz"):
+            return gzip.open(self.filename, "rb")
+        if self.filename.endswith(".zst"):
+            import zstandard
+
+            return zstandard.ZstdDecompressor().stream_reader(
+                open(self.filename, "rb"), closefd=True
+            )
+        f = open(self.filename, "rb")
+        if self.begin:
+            f.seek(self.begin)
+        return f
+
+    def __iter__(self):
+        # newline="" keeps line endings so that, the encoding using 1 byte per
+        # character, the length of lines gives the position in the file
+        with io.TextIOWrapper(
+            io.BufferedReader(self.open_binary()), encoding=ENCODING, newline=""
+        ) as f:
+            if self.end is None:
+                yield from f
+            else:
+                pos = self.begin
+                for line in f:
+                    if pos >= self.end:
+                        break
+                    pos += len(line)
+                    yield line
+
+
+def parse_lines(f, log_config):
+    """Generate (line, groups, output line) for non-empty lines from file.
+
+    Groups and output line are None for lines which do not match."""
+    parse_line = get_line_parser(log_config)
+    for line in f:
+        line = line.strip()
+        if line:
+            yield (line, ) + parse_line(line)
+
+
 def extract_data(f, log_config):
     """Extract relevant data from file - return a dictionnary."""
-    log_re, out_format = log_config
     bigdict = dict()
     dict_all = bigdict.setdefault("ALL", dict())
     clean_lst = dict_all.setdefault("clean", [])
     original_lst = dict_all.setdefault("original", [])
     no_match = dict_all.setdefault("nomatch", [])
-    for line in f:
-        line = line.strip()
-        if line:
-            m = re.match(log_re, line)
-            if m is None:
-                no_match.append(line)
-            else:
-                d = m.groupdict()
-                out_line = out_format.format(**d)
-                for k, v in d.items():
-                    bigdict.setdefault(k, dict()).setdefault(v, []).append(out_line)
-                clean_lst.append(out_line)
-            original_lst.append(line)
+    group_names = get_group_names(log_config[0])
+    group_dicts = [bigdict.setdefault(k, dict()) for k in group_names]
+    for line, groups, out_line in parse_lines(f, log_config):
+        if groups is None:
+            no_match.append(line)
+        else:
+            for group_dict, v in zip(group_dicts, groups):
+                group_dict.setdefault(v, []).append(out_line)
+            clean_lst.append(out_line)
+        original_lst.append(line)
+    # Only keep keys for which a line matched
+    for k in group_names:
+        if not bigdict[k]:
+            del bigdict[k]
+    print_no_match(f.name, no_match)
+    return bigdict
+
+
+def print_no_match(name, no_match):
+    """Print lines from file which did not match, if any."""
     if no_match:
-        print("%s lines from %s did not match:" % (len(no_match), f.name))
+        print("%s lines from %s did not match:" % (len(no_match), name))
         for line in no_match:
             print("  '" + line + "'")
-        print("%s lines from %s did not match" % (len(no_match), f.name))
-    return bigdict
+        print("%s lines from %s did not match" % (len(no_match), name))
+
+
+class ExtractedDataCache(object):
+    """On-disk cache of the data returned by extract_data.
 
+    Entries are keyed by the hash of the content of the file, the log
+    configuration and CACHE_VERSION. They are pickled: each output line is
+    stored once and the groups only refer to it. Least recently used entries
+    are removed when the cache gets bigger than max_size bytes, and entries
+    which can not be unpickled are removed when read."""
 
-def store_relevant_data_in_a_tmp_folder(f, log_config, group_keys):
+    def __init__(self, directory=CACHE_DIR, max_size=CACHE_MAX_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+
+    def get_filename(self, f, log_config):
+        """Get name of the cache entry for file - None if it can not be cached."""
+        filename = getattr(f, "filename", f.name)
+        if not os.path.isfile(filename):
+            return None
+        log_re, out_format = log_config
+        h = hashlib.sha256()
+        h.update(
+            repr(
+                (CACHE_VERSION, log_re.pattern, log_re.flags, out_format)
+                + (getattr(f, "begin", 0), getattr(f, "end", None))
+            ).encode()
+        )
+        with open(filename, "rb") as content:
+            for block in iter(lambda: content.read(1024 * 1024), b""):
+                h.update(block)
+        return os.path.join(self.directory, h.hexdigest() + ".pickle")
+
+    def extract_data(self, f, log_config):
+        """Same as extract_data, using the cache when possible."""
+        filename = self.get_filename(f, log_config)
+        if filename is None:
+            return extract_data(f, log_config)
+        try:
+            with open(filename, "rb") as cache_file:
+                bigdict = pickle.load(cache_file)
+            os.utime(filename)
+            print("%s loaded from cache %s" % (f.name, filename))
+            print_no_match(f.name, bigdict["ALL"]["nomatch"])
+            return bigdict
+        except FileNotFoundError:
+            pass
+        except (pickle.UnpicklingError, EOFError):
+            print("%s removed from cache: it can not be read" % filename)
+            os.remove(filename)
+        bigdict = extract_data(f, log_config)
+        # Write then rename so that an interrupted run leaves no partial entry
+        tmpfilename = "%s.%d.tmp" % (filename, os.getpid())
+        with open(tmpfilename, "wb") as cache_file:
+            pickle.dump(bigdict, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmpfilename, filename)
+        self.evict()
+        return bigdict
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in max_size."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".pickle"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            os.remove(path)
+            total_size -= size
+
+
+def get_group_filename(directory, key, value):
+    """Get name of the file storing lines whose group key has the value provided."""
+    cleanval = "".join(c if c.isalnum() else "_" for c in str(value))
+    return "%s/%s_%s.txt" % (directory, key, cleanval)
+
+
+def store_relevant_data_in_a_tmp_folder(f, log_config, group_keys, cache=None):
     """Store relevant data from file provided into a tmp folder."""
     # Extract relevant data from file
-    bigdict = extract_data(f, log_config)
+    bigdict = extract_data(f, log_config) if cache is None else cache.extract_data(f, log_config)
     # Store data in multiple files in a temporary folder
+    return store_data_in_a_tmp_folder(f.name, bigdict, group_keys)
+
+
+def store_data_in_a_tmp_folder(name, bigdict, group_keys, skipped_groups=()):
+    """Store data extracted from file into a tmp folder, except for the (key, value) skipped."""
     tmpdir = tempfile.mkdtemp()
-    print("%s analysed in %s" % (f.name, tmpdir))
+    print("%s analysed in %s" % (name, tmpdir))
     for k in group_keys:
         if k in bigdict:
             newdir = tmpdir + "/" + k
             os.mkdir(newdir)
             for value, lines in bigdict[k].items():
-                cleanval = "".join(c if c.isalnum() else "_" for c in str(value))
-                newfile = "%s/%s_%s.txt" % (newdir, k, cleanval)
+                if (k, value) in skipped_groups:
+                    continue
+                newfile = get_group_filename(newdir, k, value)
                 with open(newfile, "x") as file2:
                     for line in lines:
                         file2.write(line + "\n")
     return tmpdir
 
 
-def compare_files(files, log_config, group_keys, difftool):
-    """Compare files by storing relevant data into a file hierarchy compared by a dedicated tool."""
-    # Store relevant data in /tmp folders
-    tmpdirs = [
-        store_relevant_data_in_a_tmp_folder(f, log_config, group_keys) for f in files
+class FilePool(object):
+    """Buffered files opened on demand, closing the least recently used ones
+    so that at most max_open files are open at the same time."""
+
+    def __init__(self, max_open=MAX_OPEN_FILES, buffering=OUTPUT_BUFFER_SIZE):
+        self.max_open = max_open
+        self.buffering = buffering
+        self.files = collections.OrderedDict()
+        self.created = set()
+
+    def write(self, filename, line):
+        file2 = self.files.get(filename)
+        if file2 is None:
+            if len(self.files) >= self.max_open:
+                self.files.popitem(last=False)[1].close()
+            mode = "a" if filename in self.created else "x"
+            file2 = open(filename, mode, buffering=self.buffering)
+            self.created.add(filename)
+            self.files[filename] = file2
+        else:
+            self.files.move_to_end(filename)
+        file2.write(line + "\n")
+
+    def close(self):
+        while self.files:
+            self.files.popitem()[1].close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def stream_relevant_data_in_a_tmp_folder(f, log_config, group_keys, verbose=True):
+    """Store relevant data from file provided into a tmp folder.
+
+    Unlike store_relevant_data_in_a_tmp_folder, lines are written as soon as
+    they are read so that memory does not depend on the size of the file.
+    The tmp folder is only printed if verbose."""
+    tmpdir = tempfile.mkdtemp()
+    group_keys = set(group_keys)
+    # Keys to store as (index in groups, name)
+    indexed_keys = [
+        (i, k)
+        for i, k in enumerate(get_group_names(log_config[0]))
+        if k in group_keys
     ]
+    # Mapping (key, value) to filename - directories are created on first use
+    filenames = dict()
+    nb_no_match = 0
+    with FilePool() as pool:
+        if "ALL" in group_keys:
+            os.mkdir(tmpdir + "/ALL")
+            for value in ("clean", "original", "nomatch"):
+                filename = get_group_filename(tmpdir + "/ALL", "ALL", value)
+                filenames[("ALL", value)] = filename
+                open(filename, "x").close()
+                pool.created.add(filename)
+        for line, groups, out_line in parse_lines(f, log_config):
+            if groups is None:
+                if not nb_no_match:
+                    print("Lines from %s which did not match:" % f.name)
+                nb_no_match += 1
+                print("  '" + line + "'")
+                if "ALL" in group_keys:
+                    pool.write(filenames[("ALL", "nomatch")], line)
+            else:
+                for i, k in indexed_keys:
+                    v = groups[i]
+                    filename = filenames.get((k, v))
+                    if filename is None:
+                        newdir = tmpdir + "/" + k
+                        if not os.path.isdir(newdir):
+                            os.mkdir(newdir)
+                        filename = filenames[(k, v)] = get_group_filename(newdir, k, v)
+                    pool.write(filename, out_line)
+                if "ALL" in group_keys:
+                    pool.write(filenames[("ALL", "clean")], out_line)
+            if "ALL" in group_keys:
+                pool.write(filenames[("ALL", "original")], line)
+    if nb_no_match:
+        print("%s lines from %s did not match" % (nb_no_match, f.name))
+    if verbose:
+        print("%s analysed in %s" % (f.name, tmpdir))
+    return tmpdir
+
+
+def get_chunks(filename, chunk_size=CHUNK_SIZE):
+    """Split file into line-aligned byte ranges (begin, end) of about chunk_size bytes.
+
+    Compressed files and streams are not split: end is then None."""
+    f = LogFile(filename)
+    if f.is_stream() or f.is_compressed():
+        return [(0, None)]
+    size = os.path.getsize(filename)
+    bounds = [0]
+    with open(filename, "rb") as f:
+        while bounds[-1] + chunk_size < size:
+            f.seek(bounds[-1] + chunk_size)
+            f.readline()
+            if f.tell() >= size:
+                break
+            bounds.append(f.tell())
+    bounds.append(size)
+    return list(zip(bounds, bounds[1:]))
+
+
+def store_chunk_in_a_tmp_folder(chunk, log_config, group_keys):
+    """Store relevant data from chunk (filename, begin, end) into a tmp folder.
+
+    The tmp folder is not printed: it is removed once concatenated."""
+    return stream_relevant_data_in_a_tmp_folder(
+        LogFile(*chunk), log_config, group_keys, verbose=False
+    )
+
+
+def concatenate_tmp_folders(tmpdirs):
+    """Append content of the tmp folders, in order, to the first one - return it."""
+    dest = tmpdirs[0]
+    for src in tmpdirs[1:]:
+        for root, _, filenames in os.walk(src):
+            destroot = os.path.join(dest, os.path.relpath(root, src))
+            os.makedirs(destroot, exist_ok=True)
+            for filename in filenames:
+                with open(os.path.join(root, filename), "rb") as fin:
+                    with open(os.path.join(destroot, filename), "ab") as fout:
+                        shutil.copyfileobj(fin, fout)
+        shutil.rmtree(src)
+    return dest
+
+
+def store_files_in_parallel(files, log_config, group_keys, jobs, chunk_size=CHUNK_SIZE):
+    """Store relevant data from files into tmp folders using a pool of processes.
+
+    Files are split into line-aligned chunks, each one stored in its own tmp
+    folder, then the folders for a given file are concatenated in order.
+    Streams (standard input, pipes) are read by this process while the pool
+    works: they can only be read once and the workers may not have access to them."""
+    chunks = [
+        (i, (f.name, begin, end))
+        for i, f in enumerate(files)
+        if not f.is_stream()
+        for begin, end in get_chunks(f.name, chunk_size)
+    ]
+    store_chunk = functools.partial(
+        store_chunk_in_a_tmp_folder, log_config=log_config, group_keys=group_keys
+    )
+    with multiprocessing.Pool(jobs or None) as pool:
+        result = pool.map_async(store_chunk, [chunk for _, chunk in chunks], chunksize=1)
+        stream_dirs = {
+            i: stream_relevant_data_in_a_tmp_folder(f, log_config, group_keys, verbose=False)
+            for i, f in enumerate(files)
+            if f.is_stream()
+        }
+        chunk_dirs = result.get()
+    tmpdirs = []
+    for i, f in enumerate(files):
+        if i in stream_dirs:
+            tmpdir = stream_dirs[i]
+        else:
+            tmpdir = concatenate_tmp_folders(
+                [d for (j, _), d in zip(chunks, chunk_dirs) if j == i]
+            )
+        print("%s analysed in %s" % (f.name, tmpdir))
+        tmpdirs.append(tmpdir)
+    return tmpdirs
+
+
+def get_fingerprint(lines):
+    """Get fingerprint of a group of lines: different fingerprints mean different lines."""
+    h = hashlib.blake2b(digest_size=16)
+    for line in lines:
+        h.update(line.encode())
+        h.update(b"\n")
+    return h.digest()
+
+
+def get_fingerprints(bigdict, group_keys):
+    """Get mapping from (key, value) to the fingerprint of the lines of the group."""
+    return {
+        (k, value): get_fingerprint(lines)
+        for k in group_keys
+        if k in bigdict
+        for value, lines in bigdict[k].items()
+    }
+
+
+def get_file_fingerprint(filename):
+    """Get fingerprint of the content of a file."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(filename, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.digest()
+
+
+def get_unchanged_groups(fingerprints):
+    """Get (key, value) of the groups with the same fingerprint for all files.
+
+    Nothing is unchanged when there is a single file: there is nothing to compare it with."""
+    if len(fingerprints) < 2:
+        return set()
+    first, others = fingerprints[0], fingerprints[1:]
+    return {
+        group
+        for group, fingerprint in first.items()
+        if all(other.get(group) == fingerprint for other in others)
+    }
+
+
+def print_unchanged_groups(unchanged):
+    print("%d unchanged groups:" % len(unchanged))
+    for k, value in sorted(unchanged, key=str):
+        print("  %s=%s" % (k, value))
+
+
+def remove_unchanged_files(tmpdirs):
+    """Remove files which are the same in all tmp folders - return (key, filename) of the files removed.
+
+    Nothing is removed when there is a single tmp folder."""
+    removed = set()
+    if len(tmpdirs) < 2:
+        return removed
+    for root, _, filenames in os.walk(tmpdirs[0]):
+        relroot = os.path.relpath(root, tmpdirs[0])
+        for filename in filenames:
+            paths = [os.path.join(tmpdir, relroot, filename) for tmpdir in tmpdirs]
+            if all(os.path.isfile(path) for path in paths):
+                fingerprint = get_file_fingerprint(paths[0])
+                if all(get_file_fingerprint(path) == fingerprint for path in paths[1:]):
+                    for path in paths:
+                        os.remove(path)
+                    removed.add((relroot, filename))
+    return removed
+
+
+def diff_extracted_data(
+    name1, bigdict1, name2, bigdict2, group_keys, context=3, list_unchanged=False
+):
+    """Compare data extracted from 2 files group by group without any tmp folder.
+
+    A summary is printed for each key, followed by the unified diffs of the
+    groups which differ, except for COUNTED_ONLY_GROUPS whose numbers of lines
+    are printed instead. Return the number of groups which differ."""
+    diffs = []
+    nb_different = 0
+    for k in group_keys:
+        if k not in bigdict1 and k not in bigdict2:
+            continue
+        groups1 = bigdict1.get(k, dict())
+        groups2 = bigdict2.get(k, dict())
+        identical = []
+        only1 = [v for v in groups1 if v not in groups2]
+        only2 = [v for v in groups2 if v not in groups1]
+        different = []
+        counted = []
+        for value in list(groups1) + only2:
+            lines1 = groups1.get(value, [])
+            lines2 = groups2.get(value, [])
+            if lines1 == lines2:
+                identical.append(value)
+                continue
+            if (k, value) in COUNTED_ONLY_GROUPS:
+                counted.append((value, len(lines1), len(lines2)))
+                continue
+            diff = list(
+                linear_diff.unified_diff(
+                    lines1,
+                    lines2,
+                    "%s (%s=%s)" % (name1, k, value),
+                    "%s (%s=%s)" % (name2, k, value),
+                    context,
+                )
+            )
+            nb_added = sum(1 for line in diff[2:] if line.startswith("+"))
+            nb_removed = sum(1 for line in diff[2:] if line.startswith("-"))
+            different.append((value, nb_added, nb_removed))
+            diffs.append(diff)
+        print(
+            "%s: %d identical, %d different, %d only in %s, %d only in %s"
+            % (
+                k,
+                len(identical),
+                len(different) + len(counted),
+                len(only1),
+                name1,
+                len(only2),
+                name2,
+            )
+        )
+        if list_unchanged:
+            for value in identical:
+                print("  %s=%s: unchanged" % (k, value))
+        for value, nb_added, nb_removed in different:
+            print("  %s=%s: +%d -%d" % (k, value, nb_added, nb_removed))
+        for value, nb_lines1, nb_lines2 in counted:
+            print(
+                "  %s=%s: %d lines, %d lines (not diffed)"
+                % (k, value, nb_lines1, nb_lines2)
+            )
+        nb_different += len(counted)
+    for diff in diffs:
+        print()
+        for line in diff:
+            print(line)
+    return nb_different + len(diffs)
+
+
+def compare_files(
+    files,
+    log_config,
+    group_keys,
+    difftool,
+    streaming=False,
+    jobs=1,
+    cache=None,
+    skip_unchanged=False,
+):
+    """Compare files by storing relevant data into a file hierarchy compared by a dedicated tool.
+
+    The cache, if any, is only used when data is not streamed. With skip_unchanged,
+    groups whose lines are the same in all files are listed instead of being compared:
+    they are not written when data is extracted in memory, and removed afterwards when
+    data is streamed."""
+    if difftool == BUILTIN_DIFFTOOL:
+        # Compare data in memory, first file against each other file
+        bigdicts = [
+            extract_data(f, log_config) if cache is None else cache.extract_data(f, log_config)
+            for f in files
+        ]
+        for f, bigdict in zip(files[1:], bigdicts[1:]):
+            print("Comparing %s and %s" % (files[0].name, f.name))
+            diff_extracted_data(
+                files[0].name,
+                bigdicts[0],
+                f.name,
+                bigdict,
+                group_keys,
+                list_unchanged=skip_unchanged,
+            )
+        return
+
+    # Store relevant data in /tmp folders
+    if jobs != 1:
+        tmpdirs = store_files_in_parallel(files, log_config, group_keys, jobs)
+    elif streaming:
+        tmpdirs = [
+            stream_relevant_data_in_a_tmp_folder(f, log_config, group_keys)
+            for f in files
+        ]
+    elif skip_unchanged:
+        # Fingerprints of all files are needed before writing anything
+        bigdicts = [
+            extract_data(f, log_config) if cache is None else cache.extract_data(f, log_config)
+            for f in files
+        ]
+        unchanged = get_unchanged_groups(
+            [get_fingerprints(bigdict, group_keys) for bigdict in bigdicts]
+        )
+        print_unchanged_groups(unchanged)
+        tmpdirs = [
+            store_data_in_a_tmp_folder(f.name, bigdict, group_keys, unchanged)
+            for f, bigdict in zip(files, bigdicts)
+        ]
+    else:
+        tmpdirs = [
+            store_relevant_data_in_a_tmp_folder(f, log_config, group_keys, cache)
+            for f in files
+        ]
+
+    if skip_unchanged and (jobs != 1 or streaming):
+        removed = remove_unchanged_files(tmpdirs)
+        print("%d unchanged files removed:" % len(removed))
+        for relroot, filename in sorted(removed):
+            print("  %s" % os.path.join(relroot, filename))
 
     # Compare final directories in /tmp
     subprocess.run([difftool] + tmpdirs)
@@ -138,25 +772,19 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "files",
-        type=argparse.FileType("r", encoding="ISO-8859-1"),
+        type=LogFile,
         nargs="+",
-        help="Input files",
+        help="Input files, possibly compressed (.gz, .zst)",
     )
     parser.add_argument(
         "-format", choices=LOG_CONFIGS.keys(), default="ulogcat", help="Log format"
     )
     parser.add_argument(
-        "-difftool", default="meld", help="Diff tool such as meld or kompare"
+        "-difftool",
+        default="meld",
+        help="Diff tool such as meld or kompare - '%s' prints a summary and unified diffs without any tmp folder"
+        % BUILTIN_DIFFTOOL,
     )
-    default_group_keys = [
-        "tag",
-        "threadname",
-        "threadid",
-        "level",
-        "processname",
-        "processid",
-        "ALL",
-    ]
     parser.add_argument(
         "-key",
         action="append",
@@ -166,14 +794,56 @@ if __name__ == "__main__":
                 " for %s: %s" % (k, ", ".join(regexp.groupindex.keys()))
                 for (k, (regexp, _)) in LOG_CONFIGS.items()
             ),
-            default_group_keys,
+            DEFAULT_GROUP_KEYS,
         ),
     )
+    parser.add_argument(
+        "-streaming",
+        action="store_true",
+        help="Write lines to output files as they are read to keep memory usage low on huge files",
+    )
+    parser.add_argument(
+        "-jobs",
+        type=int,
+        default=1,
+        help="Number of processes used to parse files split in chunks (0 for one per CPU). Output is always streamed when more than 1.",
+    )
+    parser.add_argument(
+        "-skipunchanged",
+        action="store_true",
+        help="List groups of lines which are the same in all files instead of giving them to the diff tool",
+    )
+    parser.add_argument(
+        "-cache",
+        action="store_true",
+        help="Cache data extracted from files in %s to skip parsing on next runs (unused when data is streamed)"
+        % CACHE_DIR,
+    )
+    parser.add_argument(
+        "-cachesize",
+        type=int,
+        default=CACHE_MAX_SIZE // (1024 * 1024),
+        help="Maximum size of the cache in MB",
+    )
 
     # Get arguments
     args = parser.parse_args()
-    group_keys = default_group_keys if args.key is None else args.key
+    if args.skipunchanged and len(args.files) < 2:
+        parser.error("-skipunchanged needs at least 2 files")
+    group_keys = DEFAULT_GROUP_KEYS if args.key is None else args.key
     log_config = LOG_CONFIGS[args.format]
+    cache = (
+        ExtractedDataCache(max_size=args.cachesize * 1024 * 1024) if args.cache else None
+    )
 
     # Perform comparison
-    compare_files(args.files, log_config, group_keys, args.difftool)
+    compare_files(
+        args.files,
+        log_config,
+        group_keys,
+        args.difftool,
+        args.streaming,
+        args.jobs,
+        cache,
+        args.skipunchanged,
+    )
@@ -1,7 +1,12 @@
+import bisect
 import heapq
 import random
 import enum
 import collections
+import functools
+import itertools
+import json
+import multiprocessing
 
 
 class Order(enum.Enum):
@@ -10,29 +15,73 @@ class Order(enum.Enum):
     BIG_FIRST = enum.auto()
     RANDOM = enum.auto()
 
-    def apply(self, l):
+    def apply(self, l, rng=random):
         order_funcs = {
             Order.UNCHANGED: lambda l: None,
             Order.SMALL_FIRST: lambda l: l.sort(),
             Order.BIG_FIRST: lambda l: l.sort(reverse=True),
-            Order.RANDOM: lambda l: random.shuffle(l),
+            Order.RANDOM: lambda l: rng.shuffle(l),
         }
         l = list(l)
         order_funcs[self](l)
         return l
 
+    def get_indexes(self, l, permutation):
+        """Return indexes of the items of l in the order of apply.
+
+        The permutation is used for RANDOM."""
+        order_funcs = {
+            Order.UNCHANGED: lambda: list(range(len(l))),
+            Order.SMALL_FIRST: lambda: sorted(range(len(l)), key=l.__getitem__),
+            Order.BIG_FIRST: lambda: sorted(
+                range(len(l)), key=l.__getitem__, reverse=True
+            ),
+            Order.RANDOM: lambda: permutation,
+        }
+        return order_funcs[self]()
+
+    def apply_batch(self, l, size, rng):
+        """Return a (size, len(l)) NumPy array: one ordering per row."""
+        import numpy as np
+
+        order_funcs = {
+            Order.UNCHANGED: lambda a: a,
+            Order.SMALL_FIRST: lambda a: np.sort(a),
+            Order.BIG_FIRST: lambda a: -np.sort(-a),
+            Order.RANDOM: lambda a: rng.permuted(np.tile(a, (size, 1)), axis=1),
+        }
+        return np.broadcast_to(
+            order_funcs[self](np.array(l, dtype=float)), (size, len(l))
+        )
+
 
 class Incertitude(enum.Enum):
     CERTAIN = enum.auto()
     TRIANGULAR = enum.auto()
 
-    def apply(self, value):
+    def apply(self, value, rng=random):
         random_funcs = {
             Incertitude.CERTAIN: lambda v: v,
-            Incertitude.TRIANGULAR: lambda v: v * random.triangular(0.5, 1.5),
+            Incertitude.TRIANGULAR: lambda v: v * rng.triangular(0.5, 1.5),
         }
         return random_funcs[self](value)
 
+    def apply_factor(self, value, factor):
+        """Same as apply with factor drawn beforehand from the triangular law."""
+        random_funcs = {
+            Incertitude.CERTAIN: lambda v: v,
+            Incertitude.TRIANGULAR: lambda v: v * factor,
+        }
+        return random_funcs[self](value)
+
+    def apply_batch(self, values, rng):
+        """Vectorised version of apply on a NumPy array."""
+        random_funcs = {
+            Incertitude.CERTAIN: lambda v: v,
+            Incertitude.TRIANGULAR: lambda v: v * rng.triangular(0.5, 1, 1.5, v.shape),
+        }
+        return random_funcs[self](values)
+
 
 def my_round(value, precision):
     """
@@ -82,15 +131,29 @@ incertitude = Incertitude.CERTAIN
 incertitude = Incertitude.TRIANGULAR
 # Rounding
 rounding_precision = 1
+# Compute the exact distribution over all the orderings instead of running
+# simulations when incertitude is CERTAIN
+exact = True
+# Engine: use NumPy to run simulations by batches (much faster)
+use_numpy = False
+numpy_batch_size = 100000
+# Parallelism: simulations are split in shards, each using its own random
+# generator derived from the seed, so that results do not depend on nb_workers
+nb_workers = 1  # None for one worker per CPU
+shard_size = None  # None for numpy_batch_size with NumPy, 1000 otherwise
 # Display
 graph_char = "#"
 width_graph_count = 40
 width_graph_cum = 40
+displayed_quantiles = [0.5, 0.85, 0.95]
+# Redraw the graph every K simulations (None to draw it only at the end)
+refresh_every = None
 
 
-def run_simu():
-    tasks = [incertitude.apply(t) for t in order.apply(input_tasks)]
+def schedule(tasks, nb_consumer):
+    """Give each task in turn to the consumer with the smallest load.
 
+    Return the biggest load."""
     heap = [0] * nb_consumer
     for task in tasks:
         time = heapq.heappop(heap)
@@ -98,42 +161,304 @@ def run_simu():
     return max(heap)
 
 
-def main():
-    if reproducible:
-        print("Warning: random.seed: results will not be as random as expected")
-        random.seed(42)
-    count = collections.Counter(
-        [my_round(run_simu(), rounding_precision) for _ in range(nb_simu)]
+def run_simu(rng=random):
+    tasks = [incertitude.apply(t, rng) for t in order.apply(input_tasks, rng)]
+    return schedule(tasks, nb_consumer)
+
+
+@functools.lru_cache(maxsize=None)
+def count_makespans(loads, tasks):
+    """Count the orderings of the tasks left giving each result, with no incertitude.
+
+    loads is the sorted tuple of the loads of the consumers and tasks the sorted
+    tuple of (duration, number of tasks) left. Tasks with the same duration are
+    counted as different, like shuffling does. The result is a dict
+    {result: number of orderings}, shared by all the orderings reaching the state."""
+    if not tasks:
+        return {loads[-1]: 1}
+    counts = collections.Counter()
+    for i, (duration, number) in enumerate(tasks):
+        # Same as the heap in run_simu: the task goes to the least loaded consumer
+        new_loads = list(loads[1:])
+        bisect.insort(new_loads, loads[0] + duration)
+        new_tasks = (
+            tasks[:i] + ((duration, number - 1),) * (number > 1) + tasks[i + 1 :]
+        )
+        for result, count in count_makespans(tuple(new_loads), new_tasks).items():
+            counts[result] += number * count
+    return dict(counts)
+
+
+def get_exact_counts():
+    """Count rounded results of the orderings given by order for CERTAIN incertitude.
+
+    A deterministic order gives a single result, counted once."""
+    if order == Order.RANDOM:
+        tasks = tuple(sorted(collections.Counter(input_tasks).items()))
+        counts = count_makespans((0,) * nb_consumer, tasks)
+    else:
+        counts = {run_simu(): 1}
+    rounded = collections.Counter()
+    for result, count in counts.items():
+        rounded[my_round(result, rounding_precision)] += count
+    return rounded
+
+
+def run_simu_batch(size, rng):
+    """Vectorised version of run_simu: return results of size simulations as an array.
+
+    Each task is given to the consumer with the smallest load, just like the heap
+    does in run_simu, but for all simulations at once."""
+    import numpy as np
+
+    tasks = incertitude.apply_batch(order.apply_batch(input_tasks, size, rng), rng)
+
+    loads = np.zeros((size, nb_consumer))
+    rows = np.arange(size)
+    for task in tasks.T:
+        loads[rows, loads.argmin(axis=1)] += task
+    return loads.max(axis=1)
+
+
+def run_shard(shard):
+    """Count rounded results for a shard (seed, index, size) of simulations."""
+    seed, index, size = shard
+    if use_numpy:
+        import numpy as np
+
+        # Same stream as the index-th child of SeedSequence(seed).spawn()
+        rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(index,)))
+        return count_rounded_results_numpy(size, rng)
+    rng = random.Random("%d/%d" % (seed, index))
+    return collections.Counter(
+        my_round(run_simu(rng), rounding_precision) for _ in range(size)
     )
-    cum = 0
-    max_count = count.most_common(1)[0][1]
-    max_count_len = len(str(max_count))
-    max_cum_len = len(str(nb_simu))
-    for k in sorted(count.keys()):
-        v = count[k]
-        cum += v
-        width_count = int(width_graph_count * v / max_count)
-        graph_count_left = graph_char * width_count
-        graph_count_right = " " * (width_graph_count - width_count)
-        width_cum = int(width_graph_cum * cum / nb_simu)
-        graph_cum_left = graph_char * width_cum
-        graph_cum_right = " " * (width_graph_cum - width_cum)
-        count_str = str(v).ljust(max_count_len)
-        cum_str = str(cum).ljust(max_cum_len)
-        count_percent = "{:6.2f}%".format(v * 100 / nb_simu)
-        cum_percent = "{:6.2f}%".format(cum * 100 / nb_simu)
+
+
+def generate_counts(nb, seed):
+    """Generate counts of rounded results for nb simulations, one Counter per shard.
+
+    Shards are run by nb_workers processes and may come in any order: merging
+    the Counters gives the same result whatever the number of workers."""
+    size = shard_size or (numpy_batch_size if use_numpy else 1000)
+    shards = (
+        (seed, index, min(size, nb - begin))
+        for index, begin in enumerate(range(0, nb, size))
+    )
+    if nb_workers == 1:
+        yield from map(run_shard, shards)
+    else:
+        with multiprocessing.Pool(nb_workers) as pool:
+            yield from pool.imap_unordered(run_shard, shards)
+
+
+def count_rounded_results_numpy(nb, rng):
+    """Count results of nb simulations run by batches with NumPy."""
+    import numpy as np
+
+    count = collections.Counter()
+    for begin in range(0, nb, numpy_batch_size):
+        size = min(numpy_batch_size, nb - begin)
+        # Same computation as my_round
+        results = run_simu_batch(size, rng)
+        rounded = np.round(results / rounding_precision).astype(np.int64)
+        values, counts = np.unique(rounded, return_counts=True)
+        for v, c in zip(values.tolist(), counts.tolist()):
+            count[v * rounding_precision] += c
+    return count
+
+
+class Histogram(object):
+    """Aggregation of rounded results in bins of size rounding_precision.
+
+    Memory depends on the range of the results, not on their number."""
+
+    def __init__(self):
+        self.count = collections.Counter()
+        self.total = 0
+
+    def update(self, count):
+        self.count.update(count)
+        self.total += sum(count.values())
+
+    def quantile(self, q):
+        """Smallest bin such that a proportion q of the results is lower or equal."""
+        cum = 0
+        for k in sorted(self.count.keys()):
+            cum += self.count[k]
+            if cum >= q * self.total:
+                return k
+
+    def print(self):
+        count = self.count
+        cum = 0
+        max_count = count.most_common(1)[0][1]
+        max_count_len = len(str(max_count))
+        max_cum_len = len(str(self.total))
+        for k in sorted(count.keys()):
+            v = count[k]
+            cum += v
+            width_count = int(width_graph_count * v / max_count)
+            graph_count_left = graph_char * width_count
+            graph_count_right = " " * (width_graph_count - width_count)
+            width_cum = int(width_graph_cum * cum / self.total)
+            graph_cum_left = graph_char * width_cum
+            graph_cum_right = " " * (width_graph_cum - width_cum)
+            count_str = str(v).ljust(max_count_len)
+            cum_str = str(cum).ljust(max_cum_len)
+            count_percent = "{:6.2f}%".format(v * 100 / self.total)
+            cum_percent = "{:6.2f}%".format(cum * 100 / self.total)
+            print(
+                k,
+                graph_count_left,
+                count_str,
+                graph_count_right,
+                count_percent,
+                graph_cum_left,
+                cum_str,
+                graph_cum_right,
+                cum_percent,
+            )
         print(
-            k,
-            graph_count_left,
-            count_str,
-            graph_count_right,
-            count_percent,
-            graph_cum_left,
-            cum_str,
-            graph_cum_right,
-            cum_percent,
+            ", ".join(
+                "P%d: %s" % (q * 100, self.quantile(q)) for q in displayed_quantiles
+            )
         )
 
 
+# Scenario sweep
+################
+# Scenarios are all the combinations of the values given in a JSON config file
+# for nb_consumer, order, incertitude and rounding_precision (the values above
+# being used for missing keys), along with nb_simu and seed. For example:
+#   {"nb_simu": 10000, "nb_consumer": [3, 4, 5], "order": ["BIG_FIRST", "RANDOM"]}
+# All scenarios are evaluated on the same random draws (common random numbers):
+# differences between scenarios are due to the scenarios, not to the draws.
+SWEPT_PARAMETERS = {
+    "nb_consumer": int,
+    "order": lambda name: Order[name],
+    "incertitude": lambda name: Incertitude[name],
+    "rounding_precision": float,
+}
+
+
+def load_scenarios(filename):
+    """Load (nb_simu, seed, list of scenarios as dicts) from a JSON config file."""
+    with open(filename) as f:
+        config = json.load(f)
+    defaults = {
+        "nb_consumer": nb_consumer,
+        "order": order.name,
+        "incertitude": incertitude.name,
+        "rounding_precision": rounding_precision,
+    }
+    values = []
+    for name, parse in SWEPT_PARAMETERS.items():
+        value = config.get(name, defaults[name])
+        values.append(
+            [parse(v) for v in (value if isinstance(value, list) else [value])]
+        )
+    scenarios = [
+        dict(zip(SWEPT_PARAMETERS, combination))
+        for combination in itertools.product(*values)
+    ]
+    return config.get("nb_simu", nb_simu), config.get("seed"), scenarios
+
+
+def draw_common_random_numbers(nb, seed):
+    """Draw nb random numbers shared by all scenarios.
+
+    Each draw is (permutation of the task indexes, triangular factor of each task)."""
+    rng = random.Random(seed)
+    draws = []
+    for _ in range(nb):
+        permutation = list(range(len(input_tasks)))
+        rng.shuffle(permutation)
+        draws.append((permutation, [rng.triangular(0.5, 1.5) for _ in input_tasks]))
+    return draws
+
+
+def run_scenario(scenario, draws):
+    """Return (Histogram of the results, mean result) of a scenario for the draws."""
+    count = collections.Counter()
+    total = 0
+    for permutation, factors in draws:
+        tasks = [
+            scenario["incertitude"].apply_factor(input_tasks[i], factors[i])
+            for i in scenario["order"].get_indexes(input_tasks, permutation)
+        ]
+        result = schedule(tasks, scenario["nb_consumer"])
+        count[my_round(result, scenario["rounding_precision"])] += 1
+        total += result
+    histogram = Histogram()
+    histogram.update(count)
+    return histogram, total / len(draws)
+
+
+def sweep(filename):
+    """Evaluate all the scenarios of a config file on the same draws.
+
+    Their quantiles are printed side by side."""
+    nb, seed, scenarios = load_scenarios(filename)
+    if seed is None:
+        seed = random.SystemRandom().getrandbits(64)
+    draws = draw_common_random_numbers(nb, seed)
+    print("%d simulations per scenario, seed: %d" % (nb, seed))
+    header = (
+        ["Consumers", "Order", "Incertitude", "Rounding"]
+        + ["P%d" % (q * 100) for q in displayed_quantiles]
+        + ["Mean"]
+    )
+    rows = []
+    for scenario in scenarios:
+        histogram, mean = run_scenario(scenario, draws)
+        rows.append(
+            [
+                str(scenario["nb_consumer"]),
+                scenario["order"].name,
+                scenario["incertitude"].name,
+                "%g" % scenario["rounding_precision"],
+            ]
+            + ["%g" % histogram.quantile(q) for q in displayed_quantiles]
+            + ["%.2f" % mean]
+        )
+    widths = [max(len(row[i]) for row in [header] + rows) for i in range(len(header))]
+    for row in [header] + rows:
+        print("  ".join(cell.rjust(width) for cell, width in zip(row, widths)))
+
+
+def main():
+    if exact and incertitude == Incertitude.CERTAIN:
+        histogram = Histogram()
+        histogram.update(get_exact_counts())
+        histogram.print()
+        return
+    if reproducible:
+        print("Warning: fixed seed: results will not be as random as expected")
+        seed = 42
+    else:
+        seed = random.SystemRandom().getrandbits(64)
+    histogram = Histogram()
+    next_refresh = refresh_every
+    for count in generate_counts(nb_simu, seed):
+        histogram.update(count)
+        if refresh_every and next_refresh <= histogram.total < nb_simu:
+            next_refresh = (histogram.total // refresh_every + 1) * refresh_every
+            print("After %d/%d simulations:" % (histogram.total, nb_simu))
+            histogram.print()
+            print()
+    histogram.print()
+
+
 if __name__ == "__main__":
-    main()
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-sweep", help="JSON config file of the scenarios to compare on the same draws"
+    )
+    args = parser.parse_args()
+    if args.sweep:
+        sweep(args.sweep)
+    else:
+        main()